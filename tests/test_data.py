@@ -0,0 +1,107 @@
+import asyncio
+import unittest
+
+from zeroflo.core.data import Datas, Bytes, Contract, LowData
+from zeroflo.core.packet import Tag
+
+
+class TestBytes(unittest.TestCase):
+    def pull(self, data, low=0, high=None, flush=False, sep=b'\n'):
+        kind = Bytes(sep)
+        return kind.pull(kind.append(kind.empty(), data), low, high, flush)
+
+    def test_split_after_seperator(self):
+        batch, rest = self.pull(b'ab\ncd\nef', low=1, high=6)
+        self.assertEqual((batch, bytes(rest)), (b'ab\ncd\n', b'ef'))
+
+    def test_at_least_low(self):
+        with self.assertRaises(LowData):
+            self.pull(b'ab\ncd', low=5)
+        batch, rest = self.pull(b'ab\ncdef\ngh', low=5)
+        self.assertEqual((batch, bytes(rest)), (b'ab\ncdef\n', b'gh'))
+
+    def test_flush_takes_all(self):
+        batch, rest = self.pull(b'ab\ncd', low=5, flush=True)
+        self.assertEqual((batch, bytes(rest)), (b'ab\ncd', b''))
+
+    def test_first_seperator_after_high(self):
+        batch, rest = self.pull(b'abcdefgh\nij', low=2, high=4)
+        self.assertEqual((batch, bytes(rest)), (b'abcdefgh\n', b'ij'))
+
+    def test_no_seperator(self):
+        with self.assertRaises(LowData):
+            self.pull(b'abcdef', low=2, high=4)
+        batch, rest = self.pull(b'abcdef', low=2, high=4, sep=b'')
+        self.assertEqual((batch, bytes(rest)), (b'abcd', b'ef'))
+
+
+class TestDatas(unittest.TestCase):
+    def test_window(self):
+        kind = Datas()
+        with self.assertRaises(LowData):
+            kind.pull([1, 2], low=3)
+        self.assertEqual(kind.pull([1, 2, 3, 4, 5], low=2, high=3),
+                         ([1, 2, 3], [4, 5]))
+
+
+class TestContract(unittest.TestCase):
+    def handle(self, contract, packets):
+        batches = []
+
+        @asyncio.coroutine
+        def handle(data, tag):
+            batches.append((data, dict(tag)))
+
+        handler = contract.handler(handle)
+
+        @asyncio.coroutine
+        def feed():
+            for data, tag in packets:
+                yield from handler(data, tag)
+        asyncio.get_event_loop().run_until_complete(feed())
+        return batches
+
+    def test_merge_and_split(self):
+        batches = self.handle(Contract(Bytes(b'\n'), low=4, high=8), [
+            (b'a\nb', Tag(i=0)),
+            (b'\nc\ndddd\neeeeeeeeee\n', Tag(i=1)),
+            (b'f', Tag(i=2, flush=True))])
+        self.assertEqual([d for d, _ in batches],
+                         [b'a\nb\nc\n', b'dddd\n', b'eeeeeeeeee\n', b'f'])
+        self.assertEqual([t for _, t in batches],
+                         [{'i': 1}, {'i': 1}, {'i': 1}, {'i': 2, 'flush': True}])
+
+    def test_flush_empty_buffer(self):
+        batches = self.handle(Contract(Datas(), low=2), [
+            ([1, 2], Tag()),
+            ([], Tag(flush=True))])
+        self.assertEqual(batches, [([1, 2], {}), ([], {'flush': True})])
+
+    def test_separate_buffers_by_tag(self):
+        batches = self.handle(Contract(Datas(), low=2, by='key'), [
+            ([1], Tag(key='a')),
+            ([2], Tag(key='b')),
+            ([3], Tag(key='a'))])
+        self.assertEqual(batches, [([1, 3], {'key': 'a'})])
+
+    def test_drain(self):
+        contract = Contract(Bytes(b'\n'), low=10, by='key')
+        batches = []
+
+        @asyncio.coroutine
+        def handle(data, tag):
+            batches.append((data, dict(tag)))
+
+        handler = contract.handler(handle)
+
+        @asyncio.coroutine
+        def feed():
+            yield from handler(b'a\nb', Tag(key='a', i=0))
+            yield from handler(b'c\n', Tag(key='b', i=1))
+            self.assertEqual(handler.buffered(), 5)
+            yield from handler.drain()
+        asyncio.get_event_loop().run_until_complete(feed())
+        self.assertEqual(handler.buffered(), 0)
+        self.assertEqual(sorted(batches), [
+            (b'a\nb', {'key': 'a', 'i': 0, 'flush': True}),
+            (b'c\n', {'key': 'b', 'i': 1, 'flush': True})])
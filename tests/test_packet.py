@@ -0,0 +1,55 @@
+import pickle
+import unittest
+
+from zeroflo.core.packet import Packet, Tag
+
+
+class TestTag(unittest.TestCase):
+    def test_add_overlays(self):
+        a = Tag(a=1, foo='baz')
+        b = a.add(b=2, foo='bar')
+        self.assertEqual(a.foo, 'baz')
+        self.assertIsNone(a.b)
+        self.assertEqual(dict(b), {'a': 1, 'b': 2, 'foo': 'bar'})
+
+    def test_remove(self):
+        tag = Tag(a=1, b=2).add(c=3).remove('a', 'c', 'missing')
+        self.assertEqual(dict(tag), {'b': 2})
+        self.assertNotIn('a', tag)
+        self.assertIsNone(tag.a)
+        self.assertEqual(tag.get('c', 0), 0)
+
+    def test_noop_keeps_tag(self):
+        tag = Tag(a=1)
+        self.assertIs(tag.add(), tag)
+        self.assertIs(tag.remove('b'), tag)
+
+    def test_deep_chains_are_flattened(self):
+        tag = Tag(n=0)
+        for i in range(1, 50):
+            tag = tag.add(n=i, **{'k%d' % i: i})
+            if i % 3 == 0:
+                tag = tag.remove('k%d' % (i - 1))
+            self.assertLessEqual(tag._depth, Tag.__depth__)
+        self.assertEqual(tag.n, 49)
+        self.assertNotIn('k47', tag)
+        self.assertEqual(tag.k49, 49)
+        self.assertEqual(len(tag), 1 + 49 - 16)
+
+    def test_items_and_equality(self):
+        tag = Tag(a=1).add(b=2)
+        self.assertEqual(sorted(tag.keys()), ['a', 'b'])
+        self.assertEqual(tag, Tag(a=1, b=2))
+        self.assertEqual(tag[('a',)], Tag(a=1))
+
+    def test_pickle_flattens(self):
+        tag = Tag(a=1).add(b=2).remove('a')
+        copy = pickle.loads(pickle.dumps(tag))
+        self.assertEqual(dict(copy), {'b': 2})
+        self.assertEqual(copy._depth, 0)
+
+    def test_packet(self):
+        packet = b'data' >> Tag(a=1)
+        self.assertIsInstance(packet, Packet)
+        self.assertEqual(packet.data, b'data')
+        self.assertEqual(packet.tag.a, 1)
@@ -0,0 +1,63 @@
+import unittest
+
+import pandas as pd
+
+from zeroflo.core.ctx import Context
+from zeroflo.flows.text import Chunker, Decode, Lines, Fields
+from zeroflo.flows.pd import ToFrame, ParseTable
+
+from .test_text import run, chunked
+
+
+class TestParseTable(unittest.TestCase):
+    # short, long, blank and lines ending with the delimiter
+    data = (b'1\t2\t3\n4\n\n5\t6\t7\t8\t9\n'
+            b'a\t\nb\t\t\n\t\t\t\nc\td\n')
+
+    def setUp(self):
+        self.ctx = Context('test', setup=False)
+
+    def tearDown(self):
+        self.ctx.deactivate()
+
+    def assertSameFrames(self, ours, theirs, usecols=None):
+        self.assertEqual(len(ours), len(theirs))
+        for a, b in zip(ours, theirs):
+            df = b.data if usecols is None else b.data[usecols]
+            self.assertEqual(dict(a.tag), dict(b.tag))
+            self.assertEqual(list(a.data.columns), list(df.columns))
+            self.assertEqual(list(a.data.index), list(df.index))
+            # tells None and nan apart unlike assert_frame_equal
+            self.assertEqual(a.data.values.tolist(), df.values.tolist())
+
+    def compare(self, size, limit=-1, columns='xyz', usecols=None):
+        columns = list(columns)
+        parsed = run([ParseTable(columns=columns, limit=limit,
+                                 usecols=usecols)],
+                     chunked(self.data, size))
+        split = run([Chunker(), Decode(), Lines(), Fields(limit=limit),
+                     ToFrame(columns=columns)],
+                    chunked(self.data, size))
+        self.assertSameFrames(parsed, split, usecols)
+        return parsed
+
+    def test_as_split(self):
+        for size in [1, 3, 7, 16, len(self.data)]:
+            self.compare(size)
+
+    def test_missing_fields_are_none(self):
+        df, = [p.data for p in self.compare(len(self.data))]
+        self.assertIsNone(df.z.iloc[1])
+        self.assertTrue(pd.isnull(df.z.iloc[5]))
+
+    def test_limit_joins_rest(self):
+        for size in [5, len(self.data)]:
+            self.compare(size, limit=1)
+        df, = [p.data for p in self.compare(len(self.data), limit=1)]
+        self.assertEqual(df.y.iloc[3], '6\t7\t8\t9')
+
+    def test_more_columns(self):
+        self.compare(len(self.data), columns='uvwxyz')
+
+    def test_usecols(self):
+        self.compare(4, usecols=['z', 'x'])
@@ -0,0 +1,105 @@
+import asyncio
+import unittest
+
+from zeroflo.core.ctx import Context
+from zeroflo.core.packet import Tag
+from zeroflo.flows.text import Chunker
+
+
+def collect(unit):
+    """ packets put out by the unit """
+    packets = []
+
+    @asyncio.coroutine
+    def handle(port, packet):
+        packets.append(packet)
+    unit.out.handle = handle
+    return packets
+
+
+def run(units, packets):
+    """ packets after passing the units one after the other """
+    @asyncio.coroutine
+    def feed(unit, packets):
+        out = collect(unit)
+        yield from unit.__setup__()
+        for packet in packets:
+            yield from unit.process.method(packet.data, packet.tag)
+        return out
+
+    @asyncio.coroutine
+    def chain():
+        pks = packets
+        for unit in units:
+            pks = yield from feed(unit, pks)
+        return pks
+    return asyncio.get_event_loop().run_until_complete(chain())
+
+
+def chunked(data, size):
+    """ packets of data cut into chunks of size, flushed at the end """
+    offsets = range(0, len(data), size)
+    return [data[i:i+size] >> Tag(offset=i, flush=i+size >= len(data))
+            for i in offsets]
+
+
+def split(packets, sep):
+    """ chunks cut after their last seperator by splitting the joined data """
+    rest = b''
+    for packet in packets:
+        data, tag = packet
+        if tag.resumed and not rest:
+            _, _, data = data.partition(sep)
+        data = rest + data
+        if tag.flush:
+            rest = b''
+        else:
+            data, found, rest = data.rpartition(sep)
+            if not found:
+                data, rest = b'', data
+        if data or tag.flush:
+            yield data, dict(tag)
+
+
+class TestChunker(unittest.TestCase):
+    data = b'ab\ncdef\n\ng\r\nhijklmn\r\n\r\nop\n'
+
+    def setUp(self):
+        self.ctx = Context('test', setup=False)
+
+    def tearDown(self):
+        self.ctx.deactivate()
+
+    def compare(self, packets, sep=b'\n'):
+        chunks = run([Chunker(seperator=sep)], packets)
+        self.assertEqual([(bytes(data), dict(tag)) for data, tag in chunks],
+                         list(split(packets, sep)))
+        return chunks
+
+    def test_as_split(self):
+        for sep in [b'\n', b'\r\n']:
+            for size in [1, 2, 3, 5, 8, len(self.data)]:
+                self.compare(chunked(self.data, size), sep)
+
+    def test_memoryviews(self):
+        packets = [memoryview(data) >> tag
+                   for data, tag in chunked(self.data, 4)]
+        chunks = self.compare(packets)
+        self.assertTrue(all(isinstance(data, memoryview)
+                            for data, _ in chunks))
+
+    def test_seperator_across_chunks(self):
+        packets = [b'ab\r' >> Tag(), b'\ncd' >> Tag(), b'' >> Tag(flush=True)]
+        chunks = self.compare(packets, sep=b'\r\n')
+        self.assertEqual([bytes(data) for data, _ in chunks], [b'ab', b'cd'])
+
+    def test_resumed(self):
+        packets = [b'cd\nef' >> Tag(resumed=True),
+                   b'\ngh' >> Tag(), b'' >> Tag(flush=True)]
+        chunks = self.compare(packets)
+        self.assertEqual([bytes(data) for data, _ in chunks], [b'ef', b'gh'])
+
+    def test_resumed_without_seperator(self):
+        packets = [b'abc' >> Tag(resumed=True), b'd\nef' >> Tag(flush=True)]
+        chunks = self.compare(packets)
+        self.assertEqual([bytes(data) for data, _ in chunks], [b'd\nef'])
@@ -0,0 +1,145 @@
+import pickle
+import unittest
+
+from zeroflo.core.packet import Bundle, Tag
+from zeroflo.core.wire import (Encoder, Decoder, Compressor, Payload,
+                               codecs, encode, decode, loaded)
+
+
+def roundtrip(encoder, decoder, tgt, packet):
+    frames = encoder.encode((tgt, packet))
+    return decoder.decode([bytes(f) for f in frames])
+
+
+class TestEncoding(unittest.TestCase):
+    def test_none(self):
+        self.assertEqual(encode(None), ('none', None, b''))
+        self.assertIsNone(decode('none', None, b''))
+
+    def test_raw(self):
+        kind, codec, frame = encode(b'abc')
+        self.assertEqual((kind, codec), ('raw', None))
+        self.assertEqual(decode(kind, codec, frame), b'abc')
+
+    def test_memoryview_is_raw(self):
+        view = memoryview(b'abcdef')[2:4]
+        kind, codec, frame = encode(view)
+        self.assertEqual(kind, 'raw')
+        self.assertEqual(bytes(frame), b'cd')
+
+    def test_pickle_is_lazy(self):
+        kind, codec, frame = encode({'a': [1, 2]})
+        self.assertEqual(kind, 'pickle')
+        data = decode(kind, codec, frame)
+        self.assertIsInstance(data, Payload)
+        self.assertEqual(loaded(data), {'a': [1, 2]})
+        self.assertIs(data.load(), data.load())
+
+    def test_payload_passes_on_undecoded(self):
+        payload = Payload(pickle.dumps('text'))
+        self.assertEqual(encode(payload), ('pickle', None, payload.frame))
+
+    def test_bundle_converts_memoryviews(self):
+        bundle = Bundle([(memoryview(b'ab'), Tag(a=1)), ('c', Tag(a=2))])
+        kind, codec, frame = encode(bundle)
+        self.assertEqual(kind, 'bundle')
+        data = decode(kind, codec, frame)
+        self.assertIsInstance(data, Bundle)
+        self.assertEqual([d for d, _ in data], [b'ab', 'c'])
+        self.assertEqual([t.a for _, t in data], [1, 2])
+
+
+class TestDelta(unittest.TestCase):
+    def setUp(self):
+        self.encoder = Encoder(compress=None)
+        self.decoder = Decoder()
+
+    def test_tags_roundtrip(self):
+        tags = [Tag(path='a', offset=0),
+                Tag(path='a', offset=10),
+                Tag(path='a', offset=20, flush=True),
+                Tag(path='b'),
+                Tag()]
+        for i, tag in enumerate(tags):
+            tgt, packet = roundtrip(self.encoder, self.decoder, 7, i >> tag)
+            self.assertEqual(tgt, 7)
+            self.assertEqual(loaded(packet.data), i)
+            self.assertEqual(dict(packet.tag), dict(tag))
+
+    def test_only_changes_are_sent(self):
+        self.encoder.encode((1, None >> Tag(path='a', offset=0)))
+        _, header, _ = self.encoder.encode((1, None >> Tag(offset=1)))
+        tgt, kind, codec, delta, changed, removed = pickle.loads(header)
+        self.assertTrue(delta)
+        self.assertEqual(changed, {'offset': 1})
+        self.assertEqual(removed, ('path',))
+
+    def test_changed_types_are_sent(self):
+        roundtrip(self.encoder, self.decoder, 1, None >> Tag(n=1, x=0))
+        _, packet = roundtrip(self.encoder, self.decoder, 1,
+                              None >> Tag(n=1.0, x=False))
+        self.assertIs(type(packet.tag.n), float)
+        self.assertIs(packet.tag.x, False)
+
+    def test_changed_timezones_are_sent(self):
+        from datetime import datetime, timedelta, timezone
+        utc = datetime(2020, 1, 1, 12, tzinfo=timezone.utc)
+        cet = utc.astimezone(timezone(timedelta(hours=1)))
+        roundtrip(self.encoder, self.decoder, 1, None >> Tag(t=utc))
+        _, packet = roundtrip(self.encoder, self.decoder, 1, None >> Tag(t=cet))
+        self.assertEqual(packet.tag.t.utcoffset(), timedelta(hours=1))
+
+    def test_senders_are_separate(self):
+        other = Encoder(compress=None)
+        roundtrip(self.encoder, self.decoder, 1, None >> Tag(a=1, b=1))
+        roundtrip(other, self.decoder, 1, None >> Tag(a=2))
+        _, packet = roundtrip(self.encoder, self.decoder, 1, None >> Tag(a=1))
+        self.assertEqual(dict(packet.tag), {'a': 1})
+
+    def test_complete_tags(self):
+        encoder = Encoder(delta=False, compress=None)
+        encoder.encode((1, None >> Tag(a=1, b=2)))
+        _, header, _ = encoder.encode((1, None >> Tag(a=1)))
+        _, _, _, delta, changed, removed = pickle.loads(header)
+        self.assertFalse(delta)
+        self.assertEqual(changed, {'a': 1})
+
+    def test_bundle(self):
+        bundle = Bundle([(b'a', Tag(i=0)), (b'b', Tag(i=1))])
+        tgt, data = roundtrip(self.encoder, self.decoder, 3, bundle)
+        self.assertEqual(tgt, 3)
+        self.assertEqual(data, bundle)
+
+
+class TestCompression(unittest.TestCase):
+    def test_codecs_roundtrip(self):
+        frame = b'abcd' * 10000
+        for name, (compress, decompress) in codecs.items():
+            self.assertEqual(decompress(compress(frame)), frame, name)
+
+    def test_small_frames_are_not_compressed(self):
+        compressor = Compressor('zlib', threshold=1024)
+        self.assertEqual(compressor.compress(b'a' * 100), (None, b'a' * 100))
+
+    def test_compressed_packets_roundtrip(self):
+        encoder = Encoder(compress='zlib')
+        data = b'x' * 100000
+        frames = encoder.encode((1, data >> Tag()))
+        self.assertLess(len(frames[2]), len(data))
+        _, packet = Decoder().decode(frames)
+        self.assertEqual(packet.data, data)
+
+    def test_adaptive_skips_incompressible(self):
+        import os
+        compressor = Compressor('auto', threshold=0, probe=4)
+        noise = os.urandom(4096)
+        for _ in range(8):
+            compressor.compress(noise)
+        self.assertLess(compressor.estimate, compressor.ratio)
+        skipped = [compressor.compress(noise)[0] for _ in range(3)]
+        self.assertEqual(skipped, [None] * 3)
+        self.assertGreater(compressor.skipped, 0)
+
+    def test_unknown_codec(self):
+        with self.assertRaises(ValueError):
+            Compressor('snappy-ish')
@@ -2,6 +2,9 @@ import asyncio
 
 from asyncio import coroutine
 
-from .unit import Unit, Parts, part, inport, outport, sync, async
+from .unit import Unit, Parts, part, inport, outport, sync, async, lane, urgent, lazy
 from .ctx import Context, Setup
+from .data import contract, Datas, Bytes, Frames
+from .wire import Payload
+from .optimize import optimizer
 
@@ -1,5 +1,6 @@
 from functools import wraps
-from collections import defaultdict
+from collections import defaultdict, Counter
+from itertools import zip_longest
 
 import asyncio
 import atexit
@@ -11,9 +12,85 @@ from pyadds.logging import log
 from pyadds.forkbug import maybug
 
 from . import resolve
+from .memory import budget
+from .optimize import optimize
 from . import rpc
 from . import idd
 
+def cpu_list(text):
+    """ parse a linux cpu list like '0-3,8' """
+    cpus = set()
+    for part in text.strip().split(','):
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        cpus.update(range(int(first), int(last or first)+1))
+    return cpus
+
+
+def physical_cores():
+    """ tuples of usable logical cpus sharing one physical core """
+    try:
+        cpus = os.sched_getaffinity(0)
+    except AttributeError:
+        cpus = set(range(os.cpu_count() or 1))
+
+    cores = []
+    done = set()
+    for cpu in sorted(cpus):
+        if cpu in done:
+            continue
+        try:
+            with open('/sys/devices/system/cpu/cpu{}/topology/'
+                      'thread_siblings_list'.format(cpu)) as f:
+                siblings = cpu_list(f.read()) & cpus
+        except (OSError, ValueError):
+            siblings = set()
+        siblings.add(cpu)
+        done.update(siblings)
+        cores.append(tuple(sorted(siblings)))
+    return cores
+
+
+@log
+class Placement:
+    """ assigns cpus to the processes spawned for spaces """
+    def __init__(self):
+        self.cores = physical_cores()
+        self.siblings = {cpu: core for core in self.cores for cpu in core}
+        # first threads of all physical cores, then the second threads ...
+        self.order = [cpu for threads in zip_longest(*self.cores)
+                          for cpu in threads if cpu is not None]
+        self.used = Counter()
+        self.placed = defaultdict(list)
+
+    def spread(self, near=()):
+        candidates = self.order
+        siblings = {s for cpu in near for s in self.siblings[cpu]}.difference(near)
+        if siblings:
+            candidates = [cpu for cpu in self.order if cpu in siblings]
+        cpu = min(candidates, key=lambda c: (self.used[c], self.order.index(c)))
+        return [cpu]
+
+    def place(self, space, i=None):
+        """ cpus for the `i`th replicate of `space` or None if unplaced """
+        cores = space.cores
+        if not cores:
+            return None
+        if cores == 'spread':
+            near = [cpu for cpus in self.placed.get(space.near, []) for cpu in cpus]
+            cpus = self.spread(near)
+        elif i is not None:
+            cpus = [cores[i % len(cores)]]
+        else:
+            cpus = list(cores)
+
+        self.used.update(cpus)
+        self.placed[space].append(cpus)
+        self.__log.debug('placing %r (%s) on cpus %s', space, i, cpus)
+        return cpus
+
+
 @log
 class Process:
     def __init__(self, tracker):
@@ -24,8 +101,18 @@ class Process:
         self.units = {}
 
     @coroutine
-    def setup(self):
+    def setup(self, cores=None, memory=None):
         self.__log.debug('setting up %s', self)
+        if memory:
+            budget.limit = memory
+            self.__log.info('limited to a memory budget of %d bytes', memory)
+        if cores:
+            try:
+                os.sched_setaffinity(0, cores)
+                self.__log.info('pinned to cpus %s', cores)
+            except (AttributeError, OSError):
+                self.__log.warning('failed to pin process to cpus %s', cores,
+                                   exc_info=True)
         self.trloop = yield from self.tracker.setup()
 
     @coroutine
@@ -41,7 +128,7 @@ class Process:
         for l in outs:
             chan = yield from self.deliver[l.endpoint].register(unit, l)
             outs = self.outs[l.source.pid]
-            out = (l.target.pid, chan)
+            out = (l.target.pid, l.lane, chan)
             if out not in outs:
                 outs.append(out)
                 l.source.of(unit).handle = self.handler(l.source.pid)
@@ -66,9 +153,9 @@ class Process:
         aquire = self.tracker.aquire
         @coroutine
         def handle(self, packet):
-            aq = asyncio.gather(*(aquire(tgt) for tgt,_ in outs))
-            dl = asyncio.gather(*(chan.deliver((tgt, packet))
-                        for tgt,chan in outs))
+            aq = asyncio.gather(*(aquire(tgt) for tgt,_,_ in outs))
+            dl = asyncio.gather(*(chan.deliver((tgt, packet), lane)
+                        for tgt,lane,chan in outs))
             yield from asyncio.gather(aq, dl)
         return handle
 
@@ -81,9 +168,13 @@ class Process:
         @coroutine
         def down():
             try:
+                self.__log.debug('draining contracts of inports')
+                yield from asyncio.gather(*(
+                        port.drain() for unit in self.units.values()
+                        for port in unit.ports if hasattr(port, 'drain')))
                 self.__log.debug('shutdown closes all channels')
                 yield from asyncio.gather(*(
-                        chan.close() for outs in self.outs.values() for _,chan in outs))
+                        chan.close() for outs in self.outs.values() for _,_,chan in outs))
                 self.__log.debug('tearing down units')
                 yield from asyncio.gather(*(
                         unit.__teardown__() for unit in self.units.values()))
@@ -115,6 +206,7 @@ class Control:
         self.remotes = {}
         self.units = {}
         self.queued = []
+        self.optimized = False
         atexit.register(self.shutdown)
 
     def queue(self, coro):
@@ -137,6 +229,10 @@ class Control:
     def tracker(self):
         return rpc.Tracker(self.tp.path)
 
+    @cached
+    def placement(self):
+        return Placement()
+
     def register(self, unit):
         self.units[unit.id] = unit
 
@@ -158,7 +254,7 @@ class Control:
             self.__log.debug('spawning for {!r}'.format(space))
 
             @coroutine
-            def init_rpc(i=None):
+            def init_rpc(i=None, cores=None):
                 path = space.path
                 if i is not None:
                     path += idd.Named('replicate', 'rep-'+str(i))
@@ -171,17 +267,18 @@ class Control:
 
                 yield from remote.__setup__()
 
-                yield from remote.setup()
+                yield from remote.setup(cores=cores, memory=space.memory)
                 return remote,proc
 
+            place = self.placement.place
             if space.replicate:
                 rpcs = yield from asyncio.gather(*(
-                            init_rpc(i) for i in range(space.replicate)))
+                            init_rpc(i, place(space, i)) for i in range(space.replicate)))
                 remotes = [r for r,_ in rpcs]
                 procs   = [p for _,p in rpcs]
                 remote = rpc.Multi(remotes)
             else:
-                remote,proc = yield from init_rpc()
+                remote,proc = yield from init_rpc(cores=place(space))
                 procs = [proc]
 
             self.remotes[space] = remote
@@ -221,6 +318,10 @@ class Control:
 
     @coroutine
     def activate(self, unit, actives=set()):
+        if not self.optimized:
+            self.optimized = True
+            optimize(self.tp, self.units)
+
         u = self.tp.lookup(unit)
         self.__log.debug('activate {!r} on {!r}'.format(u, u.space))
 
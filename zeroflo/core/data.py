@@ -1,145 +1,192 @@
-from queue import Empty, Full
-import pickle
+"""
+Data contracts of ports
+-----------------------
+
+Inports can declare the kind of data they handle together with the size
+window of the batches they like to get. Incoming packets are then merged
+and split by the contract before the port's handler sees them, so units
+get right sized batches without wiring in `Collect` or `Chunker` units:
+
+>>> class Parse(Unit):
+...     @contract(Bytes(sep=b'\\n'), low=1024**2, high=4*1024**2)
+...     @inport
+...     def process(self, data, tag):
+...         ...
+
+Batches are at least `low` long (unless the packet is flushed) and at most
+`high`, as long as the kind finds a boundary to split at.
+The merged batch gets the tag of the latest packet it contains, a flushed
+packet flushes the buffer and only the last batch keeps the flush tag.
+Data still buffered when the space shuts down is put out flushed.
+
+- `Datas`: lists of items, split between items
+- `Bytes`: bytes, split after separators
+- `Frames`: pandas data frames, split at row boundaries
+"""
+from asyncio import coroutine
+from queue import Empty
 
-class LowData(Empty):
-    pass
 
-class MoreData(Full):
-    pass
+class LowData(Empty):
+    """ not enough data buffered to pull a batch """
 
-# XXX howto handle tags ...
 
 class Datas:
-    def __init__(self, tag=set()):
-        self.tag = tag
-
+    """ lists of items """
     def empty(self):
         return []
 
     def append(self, ds, d):
-        ds.append(d)
+        ds.extend(d)
         return ds
 
     def length(self, ds):
         return len(ds)
 
-    def pull(self, ds, low=None, high=None, flush=False):
-        l = self.length(ds)
-        if not l:
-            raise LowData
-        if flush and l>1:
-            raise MoreData
-        return ds[0], ds[1:]
+    def collect(self, ds):
+        return ds
 
-    def pack(self, d):
-        return pickle.dumps(d)
+    def split(self, data, cut):
+        return data[:cut], data[cut:]
 
-    def unpack(self, b):
-        return pickle.loads(b)
+    def cut(self, ds, low, high, flush):
+        return high
 
-    def map(self, d, by, num):
-        if by in self.tag:
-            yield hash(tag[by]) % num, ds
+    def pull(self, ds, low=0, high=None, flush=False):
+        """ pull a batch of `low` to `high` length -> (batch, rest) """
+        l = self.length(ds)
+        if not l or l < low and not flush:
+            raise LowData
+        cut = self.cut(ds, low, l if high is None or l <= high else high, flush)
+        if cut is None:
+            raise LowData
+        data, rest = self.split(self.collect(ds), cut)
+        return data, self.append(self.empty(), rest)
 
 
 class Bytes(Datas):
-    def __init__(self, sep=b'', tag=[]):
-        super().__init__(tag)
+    """ bytes, only split after a seperator if one is given """
+    def __init__(self, sep=b''):
         self.sep = sep
 
-    def empty(self) :
+    def empty(self):
         return bytearray()
 
-    def append(self, ds, d : bytes):
-        obj.append(self.sep)
-        obj.extend(new)
-        return obj
+    def append(self, ds, d):
+        ds += d
+        return ds
 
-    def pull(self, ds, low=0, high=None, flush=False):
-        if flush:
-            return ds, self.empty()
-        if low >= len(ds):
-            raise LowData
+    def collect(self, ds):
+        return bytes(ds)
 
+    def cut(self, ds, low, high, flush):
         sep = self.sep
-        if not sep:
-            return ds[:high], ds[high:]
-
-        sel = ds
-        pre = suf = None
-        if low:
-            pre = ds[:low]
-            sel = ds[low:]
-        if high:
-            suf = ds[high:]
-            sel = sel[:high-low]
-
-        data,*rest = sel.rsplit(sep, 1)
-        if not rest and high:
-            suf = None
-            data,*rest = ds[low:].rsplit(sep, 1)
-
-        if rest:
-            rest = rest[0]
-        else:
-            raise LowData
+        l = len(ds)
+        if not sep or flush and high == l:
+            return high
 
-        if pre:
-            pre.append(data)
-            data = pre
-        if suf:
-            rest.append(suf)
-        return data,rest
-
-    def pack(self, d):
-        return d
-
-    def unpack(self, b):
-        return bytearray(b)
+        # the batch has to end with a seperator at or after `low`
+        start = max(low - len(sep), 0)
+        pos = ds.rfind(sep, start, high)
+        if pos < 0:
+            # no seperator inside the window, so we take the first after it
+            pos = ds.find(sep, max(start, high - len(sep) + 1))
+        if pos < 0:
+            return l if flush else None
+        return pos + len(sep)
 
 
 class Frames(Datas):
-    def __init__(self, columns=[], **opts):
-        super().__init__(**opts)
-        self.columns = columns
-
-    def empty(self):
-        return pd.DataFrame(columns=[])
-
+    """ pandas data frames, buffered as a list of frames """
     def append(self, ds, d):
-        return ds.append(d)
-
-    def pull(self, ds, flush=None, high=None, low=None):
-        if flush:
-            return ds, self.empty()
-        if len(ds) < low:
-            raise LowData
-        return ds.iloc[:high], ds.iloc[high:]
+        if len(d):
+            ds.append(d)
+        return ds
 
-    def map(self, ds, by, num):
-        if by in self.columns:
-            grp = ds[by].apply(hash) % num
-            yield from ds.grouby(by)
+    def length(self, ds):
+        return sum(len(d) for d in ds)
+
+    def collect(self, ds):
+        import pandas as pd
+        if not ds:
+            return pd.DataFrame()
+        elif len(ds) == 1:
+            return ds[0]
         else:
-            yield from super().map(ds, by, num)
-
-
-class Foo(Unit):
-    @inport(Bytes)
-    def process(self, data, tag) -> Bytes(sep=b'\n'):
-        yield from ... >> tag.register(f00=1337) >> self.out
-
-    @outport(Frames)
-    def out(self, data, tag) -> Frames(columns=['a','b','c'], tag=process.tag+{'f00'}):
-        pass
-
-
-class Bar(Unit):
-    @inport
-    def process(self, data, tag) -> Frames(columns=['a', ...]):
-        yield from ... >> tag >> self.out
-
-    @outport
-    def out(self, data, tag) -> Frames(columns=process.columns-['a'], tag=process.tag):
-        pass
-
+            return pd.concat(ds)
+
+    def split(self, data, cut):
+        return data.iloc[:cut], data.iloc[cut:]
+
+
+class Contract:
+    """ merges and splits packets for a port by its data kind """
+    def __init__(self, kind, low=0, high=None, by=None):
+        self.kind = kind
+        self.low = low
+        self.high = high
+        self.by = by
+
+    def handler(self, handle):
+        """ wrap a port handler so it gets batches by the contract """
+        kind = self.kind
+        low = self.low
+        high = self.high
+        by = self.by
+        buffers = {}
+        tags = {}
+
+        @coroutine
+        def handling(data, tag):
+            key = tag[by] if by else None
+            tags.pop(key, None)
+            ds = kind.append(buffers.pop(key, None) or kind.empty(), data)
+
+            flush = bool(tag.flush)
+            partial = tag.remove('flush') if flush else tag
+            flushed = False
+            while True:
+                try:
+                    batch, ds = kind.pull(ds, low, high, flush)
+                except LowData:
+                    break
+                flushed = flush and not kind.length(ds)
+                yield from handle(batch, tag if flushed else partial)
+
+            if kind.length(ds):
+                buffers[key] = ds
+                tags[key] = partial
+            elif flush and not flushed:
+                yield from handle(kind.collect(ds), tag)
+
+        @coroutine
+        def drain():
+            """ put out all buffered data as flushed batches """
+            while buffers:
+                key = next(iter(buffers))
+                ds = buffers.pop(key)
+                tag = tags.pop(key)
+                yield from handle(kind.collect(ds), tag.add(flush=True))
+
+        def buffered():
+            """ length of the data still buffered """
+            return sum(kind.length(ds) for ds in buffers.values())
+
+        handling.drain = drain
+        handling.buffered = buffered
+        return handling
+
+    def __repr__(self):
+        return 'contract({}, low={}, high={})'.format(
+            type(self.kind).__name__, self.low, self.high)
+
+
+def contract(kind, low=0, high=None, by=None):
+    """
+    annotate an inport to get batches of `kind` with a length between
+    `low` and `high`, buffering separately by the tag value `by`
+    """
+    def annotate(port):
+        port.hints = dict(port.hints, contract=Contract(kind, low, high, by))
+        return port
+    return annotate
@@ -9,11 +9,20 @@ from pyadds.annotate import cached
 from pyadds import spawn
 from pyadds.logging import log, logging
 
-from .zmqtools import create_zmq_stream
+from .zmqtools import create_zmq_stream, select
+from .wire import Encoder, Decoder
 from ..compat import JoinableQueue
 
 linkers = {}
 
+# lanes of an endpoint, ordered by precedence
+lanes = ('urgent', 'data')
+
+def lane_address(addr, lane):
+    if lane == 'data':
+        return addr
+    return '{}-{}'.format(addr, lane)
+
 def linker(kind):
     def annotate(cls):
         linkers[kind] = cls()
@@ -52,16 +61,55 @@ class InChan(Chan):
     def done(self):
         pass
 
+    @coroutine
+    def fetch_ready(self):
+        """ the next data load if it arrived already, otherwise None """
+        return None
+
 class OutChan(Chan):
     __show__ = '>>'
 
     @coroutine
-    def deliver(self, tgt, packet):
+    def deliver(self, load, lane='data'):
         raise NotImplementedError
 
 
+class Lanes:
+    """
+    joinable queues for each lane of an endpoint,
+    `get` takes items from the most urgent lane first
+    """
+    def __init__(self, maxsize=1):
+        self.queues = {lane: JoinableQueue(maxsize) for lane in lanes}
+        self.ready = asyncio.Event()
+
+    @coroutine
+    def put(self, item, lane='data'):
+        yield from self.queues[lane].put(item)
+        self.ready.set()
+
+    @coroutine
+    def join(self, lane='data'):
+        yield from self.queues[lane].join()
+
+    @coroutine
+    def get(self):
+        queues = self.queues
+        while True:
+            for lane in lanes:
+                q = queues[lane]
+                if not q.empty():
+                    return lane, q.get_nowait()
+            yield from self.ready.wait()
+            self.ready.clear()
+
+    def task_done(self, lane):
+        self.queues[lane].task_done()
+
+
 class Linker:
     def mk(self, site):
+        """ coroutine function creating a chan for `(endpoint, hints)` """
         return {'target': self.mk_in,
                 'source': self.mk_out}[site]
 
@@ -74,14 +122,14 @@ class LocalLinker(Linker):
         try:
             return self.queues[key]
         except KeyError:
-            return self.queues.setdefault(key, JoinableQueue(1))
+            return self.queues.setdefault(key, Lanes(1))
 
     @coroutine
-    def mk_in(self, endpoint):
+    def mk_in(self, endpoint, hints={}):
         return LocalIn(endpoint, self.get_q(endpoint))
 
     @coroutine
-    def mk_out(self, endpoint):
+    def mk_out(self, endpoint, hints={}):
         return LocalOut(endpoint, self.get_q(endpoint))
 
 
@@ -101,32 +149,33 @@ class LocalIn(InChan, LocalChan):
     def __init__(self, *args, **kws):
         super().__init__(*args, **kws)
         self._needed = False
+        self._lane = None
 
     @coroutine
     def fetch(self):
-        load = yield from self.queue.get()
+        self._lane, load = yield from self.queue.get()
         return load
 
     @coroutine
     def done(self):
-        self.queue.task_done()
+        self.queue.task_done(self._lane)
 
 class LocalOut(OutChan, LocalChan):
     @coroutine
-    def deliver(self, load):
-        yield from self.queue.put(load)
-        yield from self.queue.join()
+    def deliver(self, load, lane='data'):
+        yield from self.queue.put(load, lane)
+        yield from self.queue.join(lane)
 
 
 @linker(kind='par')
 class ZmqLinker(Linker):
     @coroutine
-    def mk_in(self, endpoint):
+    def mk_in(self, endpoint, hints={}):
         return ZmqIn(endpoint)
 
     @coroutine
-    def mk_out(self, endpoint):
-        return ZmqOut(endpoint)
+    def mk_out(self, endpoint, hints={}):
+        return ZmqOut(endpoint, compress=hints.get('compress', 'auto'))
 
 
 @log
@@ -134,6 +183,7 @@ class ZmqChan(Chan):
     __stream_type__ = aiozmq.zmq.DEALER
     __stream_kind__ = None
     __stream_address__ = 'ipc://{}/chan'
+    __stream_lanes__ = lanes
 
     def __init__(self, endpoint):
         self.endpoint = endpoint
@@ -141,16 +191,21 @@ class ZmqChan(Chan):
     @coroutine
     def setup(self):
         how = self.__stream_kind__
-        addr = self.__stream_address__.format(self.endpoint.namespace())
+        self.streams = {}
 
-        self.__log.info('setting up %s::%s', addr, how)
+        for lane in self.__stream_lanes__:
+            addr = lane_address(
+                    self.__stream_address__.format(self.endpoint.namespace()), lane)
+            self.__log.info('setting up %s::%s', addr, how)
 
-        stream = yield from create_zmq_stream(self.__stream_type__, limit=64*1024)
-        stream.setsockopt(zmq.SNDHWM, 1)
-        stream.setsockopt(zmq.RCVHWM, 1)
-        stream.set_write_buffer_limits(64*1024)
-        yield from getattr(stream, how)(addr)
-        self.stream = stream
+            stream = yield from create_zmq_stream(self.__stream_type__, limit=64*1024)
+            stream.setsockopt(zmq.SNDHWM, 1)
+            stream.setsockopt(zmq.RCVHWM, 1)
+            stream.set_write_buffer_limits(64*1024)
+            yield from getattr(stream, how)(addr)
+            self.streams[lane] = stream
+
+        self.stream = self.streams['data']
         return self
 
     def __str__(self):
@@ -164,33 +219,65 @@ class ZmqIn(InChan, ZmqChan):
     __stream_kind__ = 'bind'
 
     @cached
+    def decoder(self):
+        return Decoder()
+
+    @coroutine
     def fetch(self):
-        return self.stream.pull
+        streams = self.streams
+        stream = yield from select(*(streams[lane]
+                                      for lane in self.__stream_lanes__))
+        return self.decoder.decode((yield from stream.read()))
+
+    @coroutine
+    def fetch_ready(self):
+        streams = self.streams
+        if any(streams[lane].readable for lane in self.__stream_lanes__
+               if lane != 'data'):
+            # let urgent packets go first
+            return None
+        stream = streams['data']
+        if not stream.readable:
+            return None
+        return self.decoder.decode((yield from stream.read()))
 
 
 class ZmqOut(OutChan, ZmqChan):
     __stream_kind__ = 'connect'
+    __stream_delta__ = True
+
+    def __init__(self, endpoint, compress='auto'):
+        super().__init__(endpoint)
+        self.compress = compress
 
     @cached
-    def deliver(self):
-        return self.stream.push
+    def encoders(self):
+        return {lane: Encoder(delta=self.__stream_delta__,
+                              compress=self.compress)
+                for lane in self.__stream_lanes__}
+
+    @coroutine
+    def deliver(self, load, lane='data'):
+        yield from self.streams[lane].write(*self.encoders[lane].encode(load))
 
 
 
 @linker(kind='repl')
 class ZmqReplicate(ZmqLinker):
     @coroutine
-    def mk_in(self, endpoint):
+    def mk_in(self, endpoint, hints={}):
         return ZmqWorker(endpoint)
 
     @coroutine
-    def mk_out(self, endpoint):
-        return ZmqClient(endpoint)
+    def mk_out(self, endpoint, hints={}):
+        return ZmqClient(endpoint, compress=hints.get('compress', 'auto'))
 
 
 @log
 class ZmqClient(ZmqOut):
     __stream_address__ = 'ipc://{}/chan-in'
+    # workers only see some packets of a sender, so tags are sent complete
+    __stream_delta__ = False
     proc = None
 
     @coroutine
@@ -214,11 +301,13 @@ class ZmqWorker(ZmqIn):
     __stream_kind__ = 'connect'
     __stream_type__ = aiozmq.zmq.REQ
     __stream_address__ = 'ipc://{}/chan-out'
+    # the balancer prefers urgent packets, so workers only need one stream
+    __stream_lanes__ = ('data',)
 
     @coroutine
     def fetch(self):
         yield from self.stream.write(b'')
-        return (yield from self.stream.pull())
+        return self.decoder.decode((yield from self.stream.read()))
 
 
 @log
@@ -231,9 +320,15 @@ class ZmqLoadBalance(Chan):
 
         try:
             context = zmq.Context()
-            incomming = context.socket(zmq.DEALER)
-            incomming.setsockopt(zmq.RCVHWM, 1)
-            incomming.bind('ipc://{}/chan-in'.format(self.endpoint.namespace()))
+            incommings = []
+            poller = zmq.Poller()
+            for lane in lanes:
+                incomming = context.socket(zmq.DEALER)
+                incomming.setsockopt(zmq.RCVHWM, 1)
+                incomming.bind(lane_address(
+                    'ipc://{}/chan-in'.format(self.endpoint.namespace()), lane))
+                poller.register(incomming, zmq.POLLIN)
+                incommings.append(incomming)
             outgoing = context.socket(zmq.REP)
             outgoing.setsockopt(zmq.SNDHWM, 4)
             outgoing.bind('ipc://{}/chan-out'.format(self.endpoint.namespace()))
@@ -243,12 +338,12 @@ class ZmqLoadBalance(Chan):
 
         self.__log.info("running balancer %s", self)
         while True:
-            #self.__log.debug('%s recving packet', self)
-            #fpid = incomming.recv(copy=False)
-            fpacket = incomming.recv(copy=False)
-            #self.__log.debug('%s recving client %s', self, fpacket)
             _ = outgoing.recv()
-            #self.__log.debug('%s sending packet to client', self)
-            #outgoing.send(fpid, zmq.SNDMORE, copy=False)
-            outgoing.send(fpacket, copy=False)
+            ready = dict(poller.poll())
+            # incommings are ordered by lane precedence
+            for incomming in incommings:
+                if incomming in ready:
+                    break
+            fpacket = incomming.recv_multipart(copy=False)
+            outgoing.send_multipart(fpacket, copy=False)
 
@@ -0,0 +1,130 @@
+"""
+Memory budget of a space
+------------------------
+
+Queues between units are limited by the number of packets, while packets
+range from a few bytes to hundreds of megabytes. So each space process keeps
+a `budget` of bytes for the packets it is handling and the data its units
+hold in their buffers:
+
+- the receiver acquires the size of each data packet arriving from another
+  space before passing it on and releases it once the packet is handled;
+  while the budget is exhausted it stops fetching, so backpressure
+  propagates upstream through the flow control of the links
+- packets on local links are not accounted, as their sender waits inside
+  its own handler until they are handled, so waiting for the budget there
+  could wait for itself
+- buffering units report the bytes they hold with `budget.hold(owner, n)`
+  and give them up early while `budget.exhausted`: `Collect` puts out its
+  batch, `Reorder` and the sorts spill to disk
+
+A packet is always admitted when no other packet is in flight, so a space
+keeps going even if its units hold more than the budget; units that have
+to keep their data, like `Union` waiting for ids, only slow down other
+inputs of the space.
+"""
+import sys
+import asyncio
+from asyncio import coroutine
+
+from pyadds.annotate import cached
+from pyadds.logging import log
+
+from .packet import Packet
+from .wire import Payload
+
+_size_suffixes = ['k', 'm', 'g', 't', 'p']
+
+
+def parse_size(size):
+    """ size in bytes of an `<int><suffix?>` with suffix K|M|G|T|P """
+    try:
+        size = int(size)
+    except ValueError:
+        pass
+
+    if isinstance(size, str):
+        suf = size[-1]
+        k = _size_suffixes.index(suf.lower()) + 1
+        size = int(size[:-1]) * 1024**k
+
+    if not isinstance(size, int):
+        raise TypeError('size should be an <int><suff?> with suff=K|M|G|T')
+
+    return size
+
+
+def sizeof(obj):
+    """ cheap estimate of the bytes taken by packet data """
+    if obj is None:
+        return 0
+    elif isinstance(obj, (bytes, bytearray, str)):
+        return len(obj)
+    elif isinstance(obj, memoryview):
+        return obj.nbytes
+    elif isinstance(obj, Payload):
+        return len(obj.frame)
+    elif isinstance(obj, Packet):
+        return sizeof(obj.data)
+    elif isinstance(obj, (list, tuple)):
+        return sum(map(sizeof, obj))
+
+    usage = getattr(obj, 'memory_usage', None)
+    if usage is not None:
+        # pandas, where frames return their usage per column
+        usage = usage(index=True)
+        return int(usage.sum() if hasattr(usage, 'sum') else usage)
+    nbytes = getattr(obj, 'nbytes', None)
+    if isinstance(nbytes, int):
+        return nbytes
+    return sys.getsizeof(obj)
+
+
+@log
+class Budget:
+    """ bytes of packets in flight and held by units of a space """
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.flight = 0
+        self.held = {}
+
+    @cached
+    def changed(self):
+        return asyncio.Event()
+
+    @property
+    def total(self):
+        return self.flight + sum(self.held.values())
+
+    @property
+    def exhausted(self):
+        return bool(self.limit) and self.total >= self.limit
+
+    @coroutine
+    def acquire(self, n):
+        """ wait until `n` bytes fit into the budget """
+        changed = self.changed
+        while n and self.limit and self.flight and self.total + n > self.limit:
+            self.__log.debug('budget exhausted (%d+%d/%d), waiting',
+                             self.total, n, self.limit)
+            changed.clear()
+            yield from changed.wait()
+        self.flight += n
+
+    def release(self, n):
+        self.flight -= n
+        self.changed.set()
+
+    def hold(self, owner, n):
+        """ set the bytes buffered by `owner` """
+        if n:
+            self.held[owner] = n
+        else:
+            self.held.pop(owner, None)
+        self.changed.set()
+
+    def __repr__(self):
+        return 'Budget({}/{})'.format(self.total, self.limit)
+
+
+budget = Budget()
@@ -0,0 +1,51 @@
+"""
+Optimizations of the topology
+-----------------------------
+
+Before the first unit gets activated, the control runs all registered
+optimizers once over the topology. An optimizer is a function getting the
+topology and a lookup of the unit objects by their id, that may rewire the
+flow or change parameters of units that are not active yet:
+
+>>> @optimizer('pushdown')
+... def pushdown(tp, units):
+...     ...
+
+A link with the hint `optimize=False` is left alone by the optimizers.
+"""
+optimizers = {}
+
+
+def optimizer(name):
+    """ register a function optimizing the topology """
+    def annotate(f):
+        optimizers[name] = f
+        return f
+    return annotate
+
+
+def optimizable(link):
+    """ if the link may be optimized away """
+    return (link.hints.get('optimize', True) and link.kind == 'local' and
+            not link.source.unit.active and not link.target.unit.active)
+
+
+def chain(tp, unit):
+    """
+    the unit following `unit` in the same process if they are linked
+    one-to-one, otherwise None
+    """
+    outs = tp.links_from(unit)
+    if len(outs) != 1:
+        return None
+    link, = outs
+    nxt = link.target.unit
+    if len(tp.links_to(nxt)) != 1 or not optimizable(link):
+        return None
+    return nxt
+
+
+def optimize(tp, units):
+    """ run all registered optimizers over the topology """
+    for name in sorted(optimizers):
+        optimizers[name](tp, units)
@@ -1,4 +1,10 @@
 from collections import namedtuple
+from collections.abc import Mapping
+from sys import intern
+
+_missing = object()
+_removed = object()
+
 
 class Packet(namedtuple('Packet', 'data tag')):
     """class for packets transfered inside flow"""
@@ -43,9 +49,25 @@ class Packet(namedtuple('Packet', 'data tag')):
         return (yield from port.handle(port, self))
 
 
-class Tag(dict):
+class Bundle(list):
+    """packets transfered and accounted together as one message"""
+    def __init__(self, packets=()):
+        super().__init__(Packet(*p) for p in packets)
+
+    def __str__(self):
+        return "[{}]".format(', '.join(map(str, self)))
+
+    def __repr__(self):
+        return "[{}]".format(', '.join(map(repr, self)))
+
+    def __rshift__(self, port):
+        if self:
+            return (yield from port.handle(port, self))
+
+
+class Tag(Mapping):
     """
-    tag with metainfo about the packet
+    immutable tag with metainfo about the packet
     >>> a = Tag(a=1, foo='baz')
     >>> b = a.add(b=2, foo='bar')
     >>> a.foo
@@ -54,23 +76,97 @@ class Tag(dict):
     >>> b.foo
         'bar'
     >>> None >> Tag(b)
+
+    `add` and `remove` don't copy the tag, but overlay the changes on top of
+    it. Chains are flattened once they get deeper than `__depth__`, and the
+    items are only materialized for iteration and pickling.
     """
-    def add(self, **kws):
-        new = Tag(self)
-        new.update(kws)
+    __slots__ = ('_base', '_delta', '_depth', '_items')
+    __depth__ = 8
+
+    def __init__(self, *args, **kws):
+        self._base = None
+        self._delta = self._items = {intern(k) if type(k) is str else k: v
+                                     for k, v in dict(*args, **kws).items()}
+        self._depth = 0
+
+    def _overlay(self, delta):
+        if self._depth >= self.__depth__:
+            items = dict(self._flat())
+            for k, v in delta.items():
+                if v is _removed:
+                    items.pop(k, None)
+                else:
+                    items[k] = v
+            return Tag(items)
+
+        new = object.__new__(type(self))
+        new._base = self
+        new._delta = delta
+        new._depth = self._depth + 1
+        new._items = None
         return new
 
+    def _flat(self):
+        items = self._items
+        if items is None:
+            items = dict(self._base._flat())
+            for k, v in self._delta.items():
+                if v is _removed:
+                    items.pop(k, None)
+                else:
+                    items[k] = v
+            self._items = items
+        return items
+
+    def add(self, **kws):
+        if not kws:
+            return self
+        return self._overlay(kws)
+
     def remove(self, *keys):
-        new = Tag(self)
-        for k in keys:
-            if k in new:
-                del new[k]
-        return new
+        delta = {k: _removed for k in keys if k in self}
+        if not delta:
+            return self
+        return self._overlay(delta)
 
     @classmethod
     def new(cls, **kws):
         return cls(kws)
 
+    def get(self, key, default=None):
+        tag = self
+        while tag is not None:
+            items = tag._items
+            if items is not None:
+                return items.get(key, default)
+            val = tag._delta.get(key, _missing)
+            if val is not _missing:
+                return default if val is _removed else val
+            tag = tag._base
+        return default
+
+    def __contains__(self, key):
+        return self.get(key, _missing) is not _missing
+
+    def __iter__(self):
+        return iter(self._flat())
+
+    def __len__(self):
+        return len(self._flat())
+
+    def keys(self):
+        return self._flat().keys()
+
+    def items(self):
+        return self._flat().items()
+
+    def values(self):
+        return self._flat().values()
+
+    def __reduce__(self):
+        return (type(self), (self._flat(),))
+
     def __rrshift__(self, data):
         return Packet(data, self)
 
@@ -83,7 +179,7 @@ class Tag(dict):
         if isinstance(item, tuple):
             return Tag({i: self[i] for i in item})
         else:
-            return getattr(self, item)
+            return self.get(item, None)
 
     def __repr__(self):
         return ', '.join('{}: {}'.format(k,v) for k,v in sorted(self.items()))
@@ -4,8 +4,9 @@ from contextlib import contextmanager
 import asyncio
 from asyncio import coroutine
 
-from .links import linkers
-from ..compat import JoinableQueue
+from .links import linkers, Lanes
+from .memory import budget, sizeof
+from .packet import Bundle
 
 from pyadds.logging import log
 from pyadds.forkbug import maybug
@@ -48,7 +49,8 @@ class Resolver:
             chan = self.chans[link.kind]
         except KeyError:
             mk = linkers[link.kind].mk(self.__site__)
-            chan = yield from mk(link.endpoint)
+            # the first link of the endpoint configures its chan
+            chan = yield from mk(link.endpoint, link.hints)
             self.actives[link.kind] = set()
             self.chans[link.kind] = chan
 
@@ -80,12 +82,16 @@ class Resolver:
 @log
 class Receiver(Resolver):
     __site__ = 'target'
+    # most packets coalesced into one bundle for a batch port
+    __coalesce__ = 64
 
     def __init__(self, endpoint, tracker):
         super().__init__(endpoint, tracker)
 
-        self.queue = JoinableQueue(1)
+        self.queue = Lanes(1)
         self.portmap = {}
+        self.lanemap = {}
+        self.batches = set()
         self.loops = {}
         self.main = None
 
@@ -94,7 +100,10 @@ class Receiver(Resolver):
         chan = yield from super().register(unit, link)
 
         port = link.target.of(unit)
-        self.portmap[link.target.pid] = port.handle
+        self.portmap[link.target.pid] = port.receive
+        self.lanemap[link.target.pid] = link.lane
+        if port.hints.get('batch'):
+            self.batches.add(link.target.pid)
         return chan
 
     @coroutine
@@ -104,7 +113,7 @@ class Receiver(Resolver):
         if not self.loops:
             assert not self.main
             self.main = asyncio.async(self.run())
-        self.loops[kind] = asyncio.async(self.loop(chan))
+        self.loops[kind] = asyncio.async(self.loop(chan, kind))
 
     @coroutine
     def close_chan(self, kind, chan):
@@ -114,21 +123,61 @@ class Receiver(Resolver):
         yield from asyncio.gather(loop)
 
         if not self.loops:
-            yield from self.queue.put((None, None))
+            yield from self.queue.put((None, None, 0))
             yield from self.main
             self.main = None
 
     @coroutine
-    def loop(self, chan):
+    def coalesce(self, chan, load):
+        """
+        bundle the packets for the target of `load` that already arrived
+        -> (load, count, next load for another target or None)
+        """
+        tgt, packet = load
+        bundle = Bundle(packet if isinstance(packet, Bundle) else [packet])
+        count = 1
+        while len(bundle) < self.__coalesce__:
+            nxt = yield from chan.fetch_ready()
+            if nxt is None or nxt[0] != tgt:
+                return (tgt, bundle), count, nxt
+            packet = nxt[1]
+            bundle.extend(packet if isinstance(packet, Bundle) else [packet])
+            count += 1
+        return (tgt, bundle), count, None
+
+    @coroutine
+    def loop(self, chan, kind):
         self.__log.debug('looping %s: %s', self.endpoint, chan)
+        # packets of local links are handled while their sender waits for
+        # them, so only packets coming from other spaces are accounted
+        budgeted = kind != 'local'
         fetch = chan.fetch
         done = chan.done
         join = self.queue.join
         put = self.queue.put
+        lanes = self.lanemap
+        batches = self.batches
+        acquire = budget.acquire
+        release = budget.release
+        pending = None
         while True:
-            packet = yield from fetch()
-            yield from put(packet)
-            yield from join()
+            if pending is None:
+                load = yield from fetch()
+            else:
+                load, pending = pending, None
+            lane = lanes[load[0]]
+            count = 1
+            if lane == 'data' and load[0] in batches:
+                # batch ports get what arrived meanwhile in one go
+                load, count, pending = yield from self.coalesce(chan, load)
+            # urgent packets don't wait for the memory budget
+            size = sizeof(load[1]) if budgeted and lane == 'data' else 0
+            yield from acquire(size)
+            try:
+                yield from put(load + (count,), lane)
+                yield from join(lane)
+            finally:
+                release(size)
             yield from done()
 
     @coroutine
@@ -142,12 +191,15 @@ class Receiver(Resolver):
         release = self.tracker.release
 
         while True:
-            tgt, packet = yield from get()
+            lane, (tgt, packet, count) = yield from get()
+            if tgt is None:
+                done(lane)
+                break
             with maybug(namespace=self.endpoint):
-                yield from prts[tgt](*packet)
-            yield from release(tgt)
+                yield from prts[tgt](packet)
+            yield from release(tgt, count)
 
-            done()
+            done(lane)
 
 
 class Deliver(Resolver):
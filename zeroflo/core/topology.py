@@ -3,6 +3,7 @@ from collections import defaultdict
 from pyadds.annotate import delayed
 
 from .idd import Idd, Id
+from .memory import parse_size
 
 import os
 
@@ -34,6 +35,9 @@ class Space(Idd):
         self.units = units or []
         self.pars = pars or set()
         self.bound = False
+        self.cores = None
+        self.near = None
+        self.memory = None
 
     def __str__(self):
         units = self.units
@@ -96,6 +100,10 @@ class Link:
     def endpoint(self):
         return self.target.hints['sync'](self.source, self.target)
 
+    @delayed
+    def lane(self):
+        return self.target.hints.get('lane', 'data')
+
     @delayed
     def kind(self):
         if (self.target.unit.space == self.source.unit.space or
@@ -161,6 +169,12 @@ class Topology(Idd):
                 raise ValueError("different replicate values for spaces!")
             s1.replicate = s2.replicate
 
+        if s2.cores and not s1.cores:
+            s1.cores, s1.near = s2.cores, s2.near
+
+        if s2.memory and not s1.memory:
+            s1.memory = s2.memory
+
         for u in s2.units:
             u.space = s1
             s1.units.append(u)
@@ -187,6 +201,34 @@ class Topology(Idd):
         s2.bound |= bound
         return s2
 
+    def pin(self, space, cores='spread', near=None):
+        """
+        place the processes of a space on cpu cores
+
+        Parameters
+        ----------
+        space : Space
+            the space to place, only spawned (bound) spaces are pinned
+        cores : 'spread' or list of ints, default 'spread'
+            'spread' puts each process on its own physical core, an explicit
+            list of cpus is used as a whole, or one cpu per replicate
+        near : Space, default None
+            prefer the sibling cpus of this space when spreading
+        """
+        if cores != 'spread':
+            cores = tuple(cores)
+        space.cores = cores
+        space.near = near
+        return space
+
+    def limit(self, space, memory):
+        """
+        limit the bytes of data a space's process handles and buffers,
+        see `zeroflo.core.memory`; `memory` is an int or a size like '512M'
+        """
+        space.memory = parse_size(memory)
+        return space
+
     def add_link(self, source, target, **hints):
         """ adds links between source and target port """
         src = self.get_port(source)
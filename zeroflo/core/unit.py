@@ -9,7 +9,8 @@ from pyadds.logging import log
 
 from .ctx import withtp, withctrl, withctx
 from .idd import IdPath
-from .packet import Tag
+from .packet import Tag, Bundle
+from .wire import loaded
 
 class Unit:
     """
@@ -70,6 +71,18 @@ class Unit:
         tp[self.id].space.replicate = n
         return self
 
+    @withtp
+    def pin(self, cores='spread', near=None, *, tp):
+        """ place the space of this unit on cpu cores, see `Topology.pin` """
+        tp.pin(tp[self.id].space, cores, near=near and tp[near.id].space)
+        return self
+
+    @withtp
+    def limit(self, memory, *, tp):
+        """ limit the memory of the space of this unit, see `Topology.limit` """
+        tp.limit(tp[self.id].space, memory)
+        return self
+
     def __rshift__(self, other):
         self.out >> other
         return other
@@ -211,6 +224,12 @@ class Port:
         tp.add_link(self, other)
         return other
 
+    @withtp
+    def link(self, other, *, tp, **hints):
+        """ link to another port with hints, e.g. `compress='zlib'` """
+        tp.add_link(self, other, **hints)
+        return other
+
     @withtp
     def __sub__(self, other, tp):
         if not isinstance(other, Port):
@@ -230,8 +249,48 @@ class InPort(Port):
 
     @cached
     def handle(self):
+        contract = self.hints.get('contract')
+        if contract:
+            return contract.handler(self.method)
         return self.method
 
+    @cached
+    def receive(self):
+        """ coroutine function handling a packet or bundle for this port """
+        handle = self.handle
+        lazy = self.hints.get('lazy')
+        if self.hints.get('batch'):
+            @coroutine
+            def receive(packet):
+                if not isinstance(packet, Bundle):
+                    packet = Bundle([packet])
+                if not lazy:
+                    packet = Bundle((loaded(data), tag) for data, tag in packet)
+                yield from handle(packet)
+        else:
+            @coroutine
+            def receive(packet):
+                if isinstance(packet, Bundle):
+                    for data, tag in packet:
+                        yield from handle(data if lazy else loaded(data), tag)
+                else:
+                    data, tag = packet
+                    yield from handle(data if lazy else loaded(data), tag)
+        return receive
+
+    @coroutine
+    def drain(self):
+        """ put out data still buffered by the contract of the port """
+        handle = self.handle
+        drain = getattr(handle, 'drain', None)
+        if drain is None:
+            return
+        try:
+            yield from drain()
+        except Exception:
+            self.__log.warning('dropped %d buffered by the contract of %s',
+                               handle.buffered(), self, exc_info=True)
+
 
 @log
 class OutPort(Port):
@@ -245,6 +304,9 @@ class OutPort(Port):
     def handle(self, pid, packet):
         self.__log.debug('no handler on %s for  %s by %s', self, packet, pid)
 
+    def __rrshift__(self, packets):
+        return Bundle(packets) >> self
+
     @withctrl
     def __iter__(self, ctrl):
         tp = ctrl.tp
@@ -287,6 +349,25 @@ def sync(target='unit', source='any'):
 async = sync('port')
 
 
+def lane(name='urgent'):
+    """ deliver packets for the port on a separate lane of its endpoint """
+    def annotate(port):
+        port.hints = dict(port.hints, lane=name)
+        return port
+    return annotate
+
+urgent = lane('urgent')
+
+
+def lazy(port):
+    """
+    hand data that arrived over a link to the port still encoded as
+    `Payload`, for ports that only look at the tag and pass the data on
+    """
+    port.hints = dict(port.hints, lazy=True)
+    return port
+
+
 class Parts:
     def __init__(self, *args, **kws):
         super().__init__(*args, **kws)
@@ -0,0 +1,250 @@
+"""
+Wire format of packets on zmq links
+-----------------------------------
+
+Consecutive packets on a link mostly carry nearly the same tag, so each
+sender only transmits the tag keys that changed or got removed against the
+previous packet it sent on the same socket. Receivers keep the last tag of
+every sender to rebuild the complete tag and intern repeated strings.
+
+A message consists of the frames `[sender, header, payload]`, where the
+header is the pickled `(tgt, kind, codec, delta, changed, removed)`:
+- `kind` tells how the payload frame is encoded:
+  `none` (empty frame), `raw` (bytes or memoryviews as they are),
+  `pickle` or `bundle`
+- `codec` names the compression of the payload frame or is None
+- `delta` is true if `changed`/`removed` are relative to the last tag,
+  otherwise `changed` holds the complete tag
+- bundles are sent with `changed=None` as their packets carry their own tags
+
+Pickled payloads are not decoded on arrival, but handed on as `Payload`,
+which ports annotated as `lazy` get as is. So units that only route by the
+tag pass the payload along untouched, while it gets decoded for all other
+ports.
+
+Replicated links send complete tags, as packets of one sender get
+distributed to different workers there.
+
+Payload frames are compressed with a fast codec, depending on the `compress`
+hint of the link:
+- `'auto'`: compress large payloads as long as it pays off, see `Compressor`
+- a codec name (`'zlib'`, `'lz4'` or `'zstd'`): compress all large payloads
+- `None`/`False`: never compress
+"""
+import os
+import zlib
+import pickle
+from sys import intern
+
+from .packet import Packet, Bundle, Tag
+
+_missing = object()
+
+# codecs by preference, each as (compress, decompress)
+codecs = {'zlib': (lambda frame: zlib.compress(frame, 1), zlib.decompress)}
+preferred = 'zlib'
+
+try:
+    import zstandard
+    codecs['zstd'] = (zstandard.ZstdCompressor(level=1).compress,
+                      zstandard.ZstdDecompressor().decompress)
+    preferred = 'zstd'
+except ImportError:
+    pass
+
+try:
+    import lz4.frame
+    codecs['lz4'] = (lz4.frame.compress, lz4.frame.decompress)
+    preferred = 'lz4'
+except ImportError:
+    pass
+
+
+def decompress(codec, frame):
+    if codec is None:
+        return frame
+    return codecs[codec][1](frame)
+
+
+class Compressor:
+    """
+    adaptive compression of payload frames on a link
+
+    Frames smaller than `threshold` are sent as they are. Otherwise the
+    ratio achieved gets tracked as moving average with `weight`, and while
+    it stays below `ratio`, only every `probe`th frame is compressed to
+    notice when the payloads get compressible again.
+    """
+    def __init__(self, codec='auto', threshold=16*1024,
+                 ratio=1.5, probe=32, weight=.25):
+        self.adaptive = codec == 'auto'
+        if self.adaptive:
+            codec = preferred
+        elif not codec:
+            codec = None
+        elif codec not in codecs:
+            raise ValueError('codec {!r} is not available'.format(codec))
+        self.codec = codec
+        self.threshold = threshold
+        self.ratio = ratio
+        self.probe = probe
+        self.weight = weight
+        self.estimate = ratio
+        self.skipped = 0
+
+    def compress(self, frame):
+        """ (codec, frame) of a possibly compressed frame """
+        codec = self.codec
+        if codec is None or len(frame) < self.threshold:
+            return None, frame
+
+        if self.adaptive and self.estimate < self.ratio:
+            self.skipped += 1
+            if self.skipped < self.probe:
+                return None, frame
+        self.skipped = 0
+
+        packed = codecs[codec][0](frame)
+        ratio = len(frame) / max(len(packed), 1)
+        self.estimate += self.weight * (ratio - self.estimate)
+        if len(packed) < len(frame):
+            return codec, packed
+        return None, frame
+
+
+def same(a, b):
+    """ if `b` can be left out of a delta after `a` """
+    if a is b:
+        return True
+    # values comparing equal across types (0 and False, 1 and 1.0) or
+    # instants in different zones have to be sent again
+    if type(a) is not type(b):
+        return False
+    if getattr(a, 'tzinfo', None) != getattr(b, 'tzinfo', None):
+        return False
+    try:
+        return bool(a == b)
+    except Exception:
+        return False
+
+
+def diff(last, tag):
+    """ keys changed and keys removed from `last` to `tag` """
+    get = last.get
+    changed = {k: v for k, v in tag.items()
+               if not same(get(k, _missing), v)}
+    removed = tuple(k for k in last.keys() if k not in tag)
+    return changed, removed
+
+
+def interned(items):
+    return {k: intern(v) if type(v) is str else v for k, v in items.items()}
+
+
+class Payload:
+    """ data of a packet, decoded from its frame when it is loaded """
+    __slots__ = ('frame', 'codec', '_data')
+
+    def __init__(self, frame, codec=None):
+        self.frame = frame
+        self.codec = codec
+        self._data = _missing
+
+    def load(self):
+        data = self._data
+        if data is _missing:
+            data = self._data = pickle.loads(decompress(self.codec, self.frame))
+        return data
+
+    def __reduce__(self):
+        return (type(self), (self.frame, self.codec))
+
+    def __repr__(self):
+        return 'Payload({} bytes)'.format(len(self.frame))
+
+
+def loaded(data):
+    """ decoded data of a possible payload """
+    if isinstance(data, Payload):
+        return data.load()
+    return data
+
+
+def encode(data):
+    """ (kind, codec, frame) of packet data """
+    if data is None:
+        return 'none', None, b''
+    elif type(data) is bytes or isinstance(data, memoryview):
+        return 'raw', None, data
+    elif isinstance(data, Payload):
+        return 'pickle', data.codec, data.frame
+    elif isinstance(data, Bundle):
+        return 'bundle', None, pickle.dumps(Bundle(
+            (bytes(d) if isinstance(d, memoryview) else d, t) for d, t in data))
+    else:
+        return 'pickle', None, pickle.dumps(data)
+
+
+def decode(kind, codec, frame):
+    if kind == 'none':
+        return None
+    elif kind == 'raw':
+        return decompress(codec, frame)
+    elif kind == 'pickle':
+        return Payload(frame, codec)
+    else:
+        return pickle.loads(decompress(codec, frame))
+
+
+class Encoder:
+    """ encodes packets of one sender on one socket """
+    def __init__(self, delta=True, compress='auto'):
+        self.sender = os.urandom(8)
+        self.delta = delta
+        self.compressor = Compressor(compress)
+        self.last = Tag()
+
+    def encode(self, load):
+        tgt, packet = load
+        if isinstance(packet, Bundle):
+            data = packet
+            delta, changed, removed = False, None, ()
+        else:
+            data, tag = packet
+            delta = self.delta
+            if delta:
+                changed, removed = diff(self.last, tag)
+                self.last = tag
+            else:
+                changed, removed = dict(tag.items()), ()
+
+        kind, codec, frame = encode(data)
+        if codec is None:
+            codec, frame = self.compressor.compress(frame)
+        return [self.sender,
+                pickle.dumps((tgt, kind, codec, delta, changed, removed)),
+                frame]
+
+
+class Decoder:
+    """ decodes packets, keeping the last tag of each sender """
+    def __init__(self):
+        self.lasts = {}
+
+    def decode(self, frames):
+        sender, header, frame = frames
+        tgt, kind, codec, delta, changed, removed = pickle.loads(header)
+        data = decode(kind, codec, frame)
+        if changed is None:
+            return tgt, data
+
+        changed = interned(changed)
+        if delta:
+            tag = self.lasts.get(sender) or Tag()
+            if removed:
+                tag = tag.remove(*removed)
+            tag = tag.add(**changed)
+        else:
+            tag = Tag(changed)
+        self.lasts[sender] = tag
+        return tgt, Packet(data, tag)
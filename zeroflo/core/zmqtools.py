@@ -4,6 +4,7 @@ Asyncio ZMQ tools
 
 - `create_zmq_stream`/`ZmqStream`: 
   a high level coroutine based interface to zmq messaging
+- `select`: wait for the first of several streams to become readable
 """
 
 import aiozmq
@@ -49,6 +50,24 @@ def create_zmq_stream(zmq_type, *, connect=None, bind=None, limit=None):
     return pr._stream
 
 
+@coroutine
+def select(*streams):
+    """
+    wait until one of the streams has a message to read,
+    preferring earlier streams when several are readable
+    """
+    while True:
+        for stream in streams:
+            if stream.readable:
+                return stream
+        waits = [asyncio.async(stream._pr._reading.wait()) for stream in streams]
+        try:
+            yield from asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for wait in waits:
+                wait.cancel()
+
+
 def fwd(name, iface=aiozmq.ZmqTransport):
     f = getattr(iface, name)
     @wraps(f)
@@ -87,6 +106,11 @@ class ZmqStream:
 
     abort = fwd('abort')
 
+    @property
+    def readable(self):
+        """ true if a message can be read without waiting """
+        return bool(self._pr._buffer)
+
     @coroutine
     def close(self):
         self._tr.close()
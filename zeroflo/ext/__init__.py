@@ -4,3 +4,4 @@ from .trigger import Trigger
 from .params import param, Paramed
 
 from . import bundle
+from .bundle import batch
@@ -1,5 +1,28 @@
 """
-bundling of packets with special bundling packets
+bundling of packets into single messages
+
+Inports annotated with `batch` get all packets that arrived together as one
+bundle, a list of `(data, tag)` packets, and may send a list of packets to an
+outport in one go:
+>>> class Double(Unit):
+...     @outport
+...     def out(): pass
+...
+...     @batch
+...     @inport
+...     def process(self, packets):
+...         yield from [(d*2, tag) for d, tag in packets] >> self.out
+
+A bundle is transfered as one message and accounted as one packet.
+Packets for a batch port that are already waiting on a link from another
+space when it gets a packet are coalesced into its bundle, up to
+`Receiver.__coalesce__` packets.
+Bundles arriving at normal inports are unpacked and handled packet by packet.
 """
+from ..core.packet import Bundle
 
 
+def batch(port):
+    """ annotate an inport to handle bundles of packets """
+    port.hints = dict(port.hints, batch=True)
+    return port
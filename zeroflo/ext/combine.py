@@ -55,7 +55,7 @@ class Combiner:
         self.__log.debug('flushed %s [%s]', set(vals), self)
 
         vals.clear()
-        self.tag.clear()
+        self.tag = Tag()
         for key,slot in slots.items():
             self.__log.debug('flush %s unblock [%s]', key, self)
             slot.set()
@@ -72,7 +72,7 @@ class Combiner:
         self.__log.debug('put blocks %s [%s]', key, self)
         slot.clear()
         vals[key] = val
-        self.tag.update(tag)
+        self.tag = self.tag.add(**tag)
 
         if len(vals) == len(self.slots):
             yield from self.flush()
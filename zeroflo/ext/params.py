@@ -2,29 +2,14 @@
 parameter handling for flow units ...
 """
 from pyadds.annotate import *
-from ..core.unit import inport
+from ..core.unit import inport, urgent
+from ..core.memory import parse_size
 
 import logging
 logger = logging.getLogger(__name__)
 
-_size_suffixes = ['k', 'm', 'g', 't', 'p']
 class param(Defaults, ObjDescr, Cache):
-    @staticmethod
-    def sizeof(size):
-        try:
-            size = int(size)
-        except ValueError:
-            pass
-
-        if isinstance(size, str):
-            suf = size[-1]
-            k = _size_suffixes.index(suf.lower()) + 1
-            size = int(size[:-1]) * 1024**k
-
-        if not isinstance(size, int):
-            raise TypeError('size should be an <int><suff?> with suff=K|M|G|T')
-
-        return size
+    sizeof = staticmethod(parse_size)
 
 class Paramed:
     def __init__(self, *args, **kws):
@@ -38,6 +23,7 @@ class Paramed:
                 logger.debug('param %s=%s', par.name, val)
                 par.__set__(self, par.definition(self, val))
 
+    @urgent
     @inport
     def setup(self, _, **kws):
         self.set_params(kws)
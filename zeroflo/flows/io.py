@@ -112,8 +112,8 @@ class Reader(Paramed, Unit):
                 if limit:
                     if limit <= size:
                         data = data[:limit]
-                        eof = tag.eof = True
-                        tag.limited = True
+                        eof = True
+                        tag = tag.add(eof=True, limited=True)
                     else:
                         limit -= size
 
@@ -247,6 +247,19 @@ class Writer(Paramed, Unit):
 
         return (yield from self.open(output))
 
+    def empty(self, data):
+        return not data
+
+    def write(self, data):
+        """ write data to the output, returns the number of bytes written """
+        sep = self.seperator
+        self.handle.write(data)
+        n = len(data)
+        if data[-len(sep):] != sep:
+            self.handle.write(sep)
+            n += len(sep)
+        return n
+
     @outport
     def count(): pass
 
@@ -259,17 +272,13 @@ class Writer(Paramed, Unit):
 
         self._processing = True
         n=0
-        if data:
+        if not self.empty(data):
             if not self.handle:
                 self.__log.info('opening %s for output', path)
                 self.last = path
                 self.handle = yield from self._open(path)
 
-            self.handle.write(data)
-            n += len(data)
-            if not data.endswith(self.seperator):
-                self.handle.write(self.seperator)
-                n += len(self.seperator)
+            n += self.write(data)
 
             yield from asyncio.gather(
                 self.handle.drain(),
@@ -1,15 +1,23 @@
-from ..core import Unit, outport, inport, coroutine
+from ..core import Unit, outport, inport, coroutine, optimizer
+from ..core.optimize import chain
 from ..ext import param, Paramed
-from ..flows.tools import Collect
+from ..core.memory import budget, sizeof
+from ..flows.tools import Collect, Spill, SortedMerge
 
 from pyadds.logging import log
 
 import pandas as pd
 import numpy as np
+import csv
 import re
 import io
+import zlib
+import logging
 
-from functools import wraps
+from functools import wraps, partial
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
 
 def skip_empty(port):
     @wraps(port)
@@ -21,6 +29,17 @@ def skip_empty(port):
     return skipping
 
 
+def pushable(port):
+    """ pass data on unchanged once the unit is pushed into a parser """
+    @wraps(port)
+    def passing(self, data, tag):
+        if self.pushed:
+            yield from data >> tag >> self.out
+        else:
+            yield from port(self, data, tag)
+    return passing
+
+
 class ToSeries(Unit):
     """ converts a list to a seires """
     @outport
@@ -55,32 +74,203 @@ class ToFrame(Paramed, Unit):
     @outport
     def out(): pass
 
+    def column(self, values, index, dtype=None):
+        """ series of an object array with na values masked """
+        series = pd.Series(values, index=index, copy=False)
+        series[series.isin(self.na_values).values] = np.nan
+        if dtype is not None:
+            series = series.astype(dtype)
+        return series
+
     @inport
     def process(self, data, tag):
-        df = pd.DataFrame(data or None)
-        if len(df.columns) < len(self.columns):
-            df.columns = self.columns[:len(df.columns)]
-            df = df.reindex(columns=self.columns)
-        elif len(df.columns) > len(self.columns):
-            df = df.iloc[:, :len(self.columns)]
-            df.columns = self.columns
+        columns = self.columns
+        if not data:
+            df = pd.DataFrame(columns=columns)
         else:
-            df.columns = self.columns
+            # rows padded with None or cut to the number of columns
+            values = pd.lib.to_object_array(data, len(columns))
+            index = pd.Index(np.arange(len(values)) + (tag.offset or 0))
+            dtypes = self.dtypes
+            df = pd.DataFrame(
+                    {col: self.column(values[:, i], index, dtypes.get(col))
+                     for i, col in enumerate(columns)},
+                    columns=columns, index=index)
 
-        if not df.empty:
-            df.index += tag.offset or 0
-            df[df.applymap(self.na_values.__contains__)] = np.nan
-            for col,dtype in self.dtypes.items():
+        yield from df >> tag.add(size=len(df)) >> self.out
+
+
+@log
+class ParseTable(Paramed, Unit):
+    """
+    parses raw byte chunks of delimited text directly into frames
+
+    Gives the same frames as `Chunker >> Decode >> Lines >> Fields >> ToFrame`
+    (except for empty chunks, which give empty frames), but lets the C parser
+    of `read_csv` build the columns instead of python lists per line.
+    Fields are not quoted, the separators have to be single bytes in the
+    `encoding`.
+    """
+    @param
+    def seperator(self, val=b'\n'):
+        """ line separator """
+        assert len(val) == 1
+        return val
+
+    @param
+    def delimiter(self, val='\t'):
+        """ field separator """
+        assert len(val) == 1
+        return val
+
+    @param
+    def limit(self, val=-1):
+        """ maximal number of splits, the rest stays in the last field """
+        return val
+
+    @param
+    def columns(self, val):
+        return list(val)
+
+    @param
+    def dtypes(self, val={}):
+        return val
+
+    @param
+    def na_values(self, val=''):
+        if not isinstance(val, list):
+            val = [val]
+        return val
+
+    @param
+    def encoding(self, val='utf-8'):
+        return val
+
+    @param
+    def usecols(self, val=None):
+        """ columns to parse in the order of the frame, all by default """
+        if val is not None:
+            val = list(val)
+        return val
+
+    @param
+    def predicates(self, val=[]):
+        """ functions filtering the rows of the parsed frames """
+        return list(val)
+
+    @outport
+    def out(): pass
+
+    @coroutine
+    def __setup__(self):
+        self.rest = b''
+
+    @property
+    def used(self):
+        """ names of the parsed columns """
+        if self.usecols is None:
+            return self.columns
+        return self.usecols
+
+    def fields(self, data):
+        """ number of fields for each line of data """
+        sep, = self.seperator
+        delim, = self.delimiter.encode(self.encoding)
+        buf = np.frombuffer(data, dtype=np.uint8)
+        ends = np.flatnonzero(buf == sep)
+        delims = np.flatnonzero(buf == delim)
+        return np.bincount(np.searchsorted(ends, delims),
+                           minlength=len(ends)+1) + 1
+
+    def parse(self, data):
+        """ object array of the fields of each line """
+        counts = self.fields(data)
+        width = counts.max()
+        keep = [self.columns.index(col) for col in self.used]
+
+        limit = self.limit
+        joined = 0 <= limit < width - 1
+        # the rest of the line has to be read to join it into the last field
+        read = list(range(width)) if joined else [i for i in keep if i < width] or [0]
+
+        # the appended separator ends the last line, so a trailing one
+        # gives an empty line just as splitting does
+        df = pd.read_csv(io.BytesIO(data + self.seperator),
+                         sep=self.delimiter, header=None, names=list(range(width)),
+                         usecols=read, engine='c', quoting=csv.QUOTE_NONE,
+                         lineterminator=self.seperator.decode(self.encoding),
+                         skip_blank_lines=False, na_filter=False,
+                         dtype=object, encoding=self.encoding)
+        assert len(df) == len(counts), 'lines got lost while parsing'
+        values = df[read].values
+
+        if joined:
+            delim = self.delimiter
+            for i in np.flatnonzero(counts > limit + 1):
+                values[i, limit] = delim.join(values[i, limit:counts[i]])
+            values = values[:, :limit+1]
+            read = read[:limit+1]
+            counts = np.minimum(counts, limit+1)
+
+        at = {col: j for j, col in enumerate(read)}
+        parsed = np.empty((len(values), len(keep)), dtype=object)
+        for j, col in enumerate(keep):
+            if col in at:
+                parsed[:, j] = values[:, at[col]]
+        # missing fields are None as in the rows padded by ToFrame
+        parsed[np.array(keep) >= counts[:, None]] = None
+        return parsed
+
+    @inport
+    def process(self, data, tag):
+        if tag.resumed and not self.rest:
+            # resumed in the middle of a record that was already delivered
+            _, _, data = data.partition(self.seperator)
+
+        data = self.rest + data
+        if tag.flush:
+            self.rest = b''
+        else:
+            data, sep, rest = data.rpartition(self.seperator)
+            if not sep:
+                data, rest = b'', data
+            self.rest = rest
+
+        if not data:
+            if tag.flush:
+                df = pd.DataFrame(columns=self.used)
+                yield from df >> tag.add(size=0) >> self.out
+            return
+
+        df = pd.DataFrame(self.parse(data), columns=self.used)
+        size = len(df)
+        df.index += tag.offset or 0
+        df[df.isin(self.na_values)] = np.nan
+        for col, dtype in self.dtypes.items():
+            if col in df:
                 df[col] = df[col].astype(dtype)
+        for where in self.predicates:
+            df = where(df)
 
-        yield from df >> tag.add(size=len(df)) >> self.out
+        yield from df >> tag.add(size=size) >> self.out
 
 
+@log
 class ToTable(Unit):
-    """ converts raw data (bytes) with read_table """
-    def __init__(self, **opts):
+    """
+    converts raw data (bytes) with read_table
+
+    With `stream=True` the chunks are parsed as parts of one table per file,
+    which ends with a flushed packet: the header is only read at the start of
+    each file, an incomplete last line is carried over to the next chunk, and
+    the names and dtypes of the first chunk are kept for all following ones.
+    """
+    def __init__(self, stream=False, **opts):
         super().__init__()
+        self.stream = stream
         self.opts = opts
+        self.usecols = None
+        self.predicates = []
 
     @outport
     def out():
@@ -89,18 +279,95 @@ class ToTable(Unit):
     @coroutine
     def __setup__(self):
         self.offset = 0
+        self.rest = bytearray()
+        self.terminator = self.opts.get('lineterminator', '\n').encode()
+        self.names = None
+        self.dtypes = None
+        self.started = False
+
+    def parse(self, data):
+        """ parse a chunk of the stream with the schema of the first one """
+        if not data:
+            return pd.DataFrame(columns=self.names)
+
+        if self.names is None:
+            df = pd.read_table(io.BytesIO(data), **self.opts)
+            self.names = list(df.columns)
+            # read_table can only fix plain dtypes, dates are parsed by opts
+            self.dtypes = {col: dtype for col, dtype in df.dtypes.items()
+                           if dtype.kind in 'biuf'}
+            return df
+
+        opts = dict(self.opts, names=self.names)
+        header = opts.pop('header', 'infer')
+        if self.started or header is None:
+            opts['header'] = None
+        else:
+            opts['header'] = 0 if header == 'infer' else header
+
+        try:
+            return pd.read_table(io.BytesIO(data), dtype=self.dtypes, **opts)
+        except (ValueError, TypeError, OverflowError):
+            self.__log.info('chunk does not fit dtypes %s, reading without', self.dtypes)
+            return pd.read_table(io.BytesIO(data), **opts)
+
+    def cut(self, data, flush):
+        """ complete lines of the carried over rest and data """
+        rest = self.rest
+        rest += data
+        if flush:
+            chunk = bytes(rest)
+            del rest[:]
+        else:
+            end = rest.rfind(self.terminator) + len(self.terminator)
+            chunk = bytes(rest[:end])
+            del rest[:end]
+        return chunk
 
     @inport
     def process(self, data, tag):
         """ port getting bytes data """
-        df = pd.read_table(io.BytesIO(data), **self.opts)
+        if self.stream:
+            data = self.cut(data, tag.flush)
+            if not data and not tag.flush:
+                return
+            df = self.parse(data)
+            self.started = not tag.flush
+        else:
+            df = pd.read_table(io.BytesIO(data), **self.opts)
+            if self.usecols is not None:
+                # read_table keeps the order of the file
+                df = df[self.usecols]
         length = len(df)
         if not df.empty:
             df.index += self.offset
         self.offset += length
+        for where in self.predicates:
+            df = where(df)
         yield from df >> tag.add(length=length) >> self.out
 
 
+class Formatter:
+    """
+    formats frames with `to_csv` into a binary buffer reused for all frames,
+    instead of building a string and encoding it
+    """
+    def __init__(self, encoding='utf-8', **opts):
+        self.buffer = io.BytesIO()
+        self.text = io.TextIOWrapper(self.buffer, encoding=encoding, newline='')
+        self.opts = opts
+
+    @contextmanager
+    def formatted(self, data, header=False):
+        """ memoryview of the formatted frame, valid inside the context """
+        buffer = self.buffer
+        buffer.seek(0)
+        data.to_csv(self.text, header=header, **self.opts)
+        self.text.flush()
+        with buffer.getbuffer() as whole, whole[:buffer.tell()] as view:
+            yield view
+
+
 class DumpTable(Unit):
     def __init__(self, **opts):
         super().__init__()
@@ -112,19 +379,56 @@ class DumpTable(Unit):
 
     @coroutine
     def __setup__(self):
-        self.header = self.opts.pop('header', False)
+        opts = dict(self.opts)
+        self.header = opts.pop('header', False)
+        self.formatter = Formatter(**opts)
 
     @inport
     def process(self, data, tag):
         """ port getting bytes data """
         if data.empty:
             return
-        out = io.StringIO()
-        data.to_csv(out, header=self.header, **self.opts)
+        with self.formatter.formatted(data, self.header) as view:
+            out = bytes(view)
         if self.header:
             self.header=False
 
-        yield from out.getvalue().encode() >> tag >> self.out
+        yield from out >> tag >> self.out
+
+
+class TableWriter:
+    """
+    mixin for `io.Writer`s formatting frames themselves, saving the
+    `DumpTable` unit and passing its packets on
+
+    >>> class PBzTableWriter(TableWriter, PBzWriter):
+    ...     pass
+    >>> PBzTableWriter(output=..., table={'sep': '\\t', 'header': True})
+    """
+    headed = None
+
+    @param
+    def table(self, val={}):
+        """ options of `to_csv`, the header is written once per file """
+        return dict(val)
+
+    @coroutine
+    def __setup__(self):
+        yield from super().__setup__()
+        opts = dict(self.table)
+        self.header = opts.pop('header', False)
+        self.formatter = Formatter(**opts)
+
+    def empty(self, data):
+        return data.empty
+
+    def write(self, data):
+        header = self.header and self.headed != self.last
+        self.headed = self.last
+        with self.formatter.formatted(data, header) as view:
+            # transports may keep the data buffered, so they get their copy
+            data = bytes(view)
+        return super().write(data)
 
 
 class Fill(Paramed, Unit):
@@ -162,10 +466,69 @@ class Convert(Paramed, Unit):
         yield from data >> tag >> self.out
 
 
+def sort_frame(frame, by=None):
+    """ stable sort of a frame by a column or the index """
+    if by is None:
+        return frame.sort_index(kind='mergesort')
+    return frame.sort_values(by, kind='mergesort')
+
+
+def sort_keys(frame, by=None):
+    return frame.index.values if by is None else frame[by].values
+
+
+def merge_frames(runs, by=None):
+    """
+    merge iterators over chunks of sorted frames into sorted frames
+
+    Each round takes the rows up to the smallest last key of the current
+    chunks from all runs, found with `searchsorted`, and sorts just these.
+    """
+    heads = []
+    for run in runs:
+        head = next(run, None)
+        if head is not None:
+            heads.append((head, run))
+
+    while heads:
+        if len(heads) == 1:
+            head, run = heads.pop()
+            yield head
+            yield from run
+            break
+
+        bound = min(sort_keys(head, by)[-1] for head, _ in heads)
+        parts = []
+        rest = []
+        for head, run in heads:
+            cut = np.searchsorted(sort_keys(head, by), bound, side='right')
+            parts.append(head.iloc[:cut])
+            if cut < len(head):
+                rest.append((head.iloc[cut:], run))
+            else:
+                head = next(run, None)
+                if head is not None:
+                    rest.append((head, run))
+        heads = rest
+        yield sort_frame(pd.concat(parts), by)
+
+
 @log
 class Sort(Paramed, Unit):
+    """ external sort of frames, spilling sorted runs to disk """
     @param
     def by(self, val=None):
+        """ column to sort by, the index if None """
+        return val
+
+    @param
+    def spill(self, val='256m'):
+        """ spill a sorted run when holding this many bytes """
+        return param.sizeof(val)
+
+    @param
+    def chunk(self, val=64*1024):
+        """ number of rows per spilled chunk """
         return val
 
     @outport
@@ -174,29 +537,61 @@ class Sort(Paramed, Unit):
     @coroutine
     def __setup__(self):
         self.buf = []
+        self.held = 0
         self.tag = None
+        self.spilled = Spill(self.chunk)
 
     @coroutine
-    def flush(self):
-        new = pd.concat(self.buf)
-        self.__log.debug('flushing out %d lines', len(new))
-        yield from new >> self.tag.add(sorted=True) >> self.out
+    def __teardown__(self):
+        self.spilled.close()
+
+    def release(self):
         self.buf = []
+        self.held = 0
+        budget.hold(self, 0)
+
+    def chunked(self, frame):
+        chunk = self.chunk
+        return (frame.iloc[i:i+chunk] for i in range(0, len(frame), chunk))
+
+    @coroutine
+    def flush(self):
+        runs = self.spilled.take()
+        if self.buf:
+            runs.append(self.chunked(sort_frame(pd.concat(self.buf), self.by)))
+        self.release()
+        self.__log.debug('flushing out %d runs', len(runs))
+
+        tag = self.tag.add(sorted=True)
+        partial = tag.remove('flush')
+        last = None
+        for frame in merge_frames(runs, self.by):
+            if last is not None:
+                yield from last >> partial >> self.out
+            last = frame
+        if last is not None:
+            yield from last >> tag >> self.out
 
     @inport
     def process(self, data, tag):
         if tag.sorted:
-            if self.buf:
+            if self.buf or self.spilled:
                 yield from self.flush()
             yield from data >> tag >> self.out
             return
 
         self.buf.append(data)
+        self.held += sizeof(data)
+        budget.hold(self, self.held)
         self.tag = tag
         self.__log.debug('adding %d lines -> %d', len(data), len(self.buf))
 
         if tag.flush:
             yield from self.flush()
+        elif self.held >= self.spill or budget.exhausted:
+            self.__log.debug('spilling %d frames', len(self.buf))
+            self.spilled.add(sort_frame(pd.concat(self.buf), self.by))
+            self.release()
 
 
 class IndexContinued(Unit):
@@ -242,18 +637,24 @@ class Columns(Paramed, Unit):
             val = pd.Index(val)
         return val
 
+    pushed = False
+
     @outport
     def out(): pass
 
-    @inport
-    def process(self, data: pd.DataFrame, tag):
-        cols = data.columns
+    def keep(self, cols):
+        """ the columns kept of `cols` """
+        cols = pd.Index(cols)
         if self.drop is not None:
             cols = cols.difference(self.drop)
         if self.select is not None:
             cols = cols.intersection(self.select)
+        return cols
 
-        yield from data[cols] >> tag >> self.out
+    @inport
+    @pushable
+    def process(self, data: pd.DataFrame, tag):
+        yield from data[self.keep(data.columns)] >> tag >> self.out
 
 
 fill_dtypes = {
@@ -261,12 +662,46 @@ fill_dtypes = {
     np.dtype(int): 0,
 }
 
-class InferTypes(Unit):
+bools = {'True': True, 'TRUE': True, 'true': True,
+         'False': False, 'FALSE': False, 'false': False}
+
+
+@log
+class InferTypes(Paramed, Unit):
+    """
+    infers the types of object columns and converts them
+
+    With `cache` the conversions inferred for each column are kept per
+    `by` tag value and replayed with vectorized casts on later chunks,
+    columns are only inferred again when a cast fails. Columns that were
+    not converted to a type yet (empty or only strings) are inferred for
+    each chunk until they are.
+    """
+    @param
+    def cache(self, val=False):
+        return val
+
+    @param
+    def by(self, val=None):
+        """ tag key to keep separate conversions for """
+        return val
+
+    @param
+    def sample(self, val=None):
+        """ number of rows to infer from, all if None """
+        return val
+
     @outport
     def out(): pass
 
+    @coroutine
+    def __setup__(self):
+        self.schemas = {}
+
     @staticmethod
-    def try_convert(x):
+    def infer(x):
+        """ (steps, converted) with the steps of the conversion inferred """
+        steps = []
         dn = x.dropna().astype(str)
 
         # convert user ids to int
@@ -275,14 +710,15 @@ class InferTypes(Unit):
             if (dn.str[:1]=='u').all():
                 dn = dn.str[1:].astype(int)
                 x = dn.reindex(x.index, fill_value=0)
+                steps.append('uid')
         except ValueError:
             pass
 
         conv = []
-        for convert,*args in [
-                (pd.lib.maybe_convert_numeric, {'nan', 'NaN'}),
-                (pd.lib.try_parse_dates,),
-                (pd.lib.maybe_convert_bool,),
+        for step,convert,*args in [
+                ('numeric', pd.lib.maybe_convert_numeric, {'nan', 'NaN'}),
+                ('dates', pd.lib.try_parse_dates,),
+                ('bool', pd.lib.maybe_convert_bool,),
             ]:
             try:
                 conv = convert(dn.values, *args)
@@ -290,8 +726,11 @@ class InferTypes(Unit):
                     break
             except ValueError as e:
                 pass
+        else:
+            step = 'object'
 
         if len(conv):
+            steps.append(step)
             dn = pd.Series(conv, dn.index)
             x = pd.Series(conv, index=dn.index).reindex(index=x.index,
                     fill_value=fill_dtypes.get(conv.dtype, np.nan))
@@ -303,12 +742,81 @@ class InferTypes(Unit):
             if len(dates) and ((dates > 5e11) & (dates < 20e11)).all():
                 dn = dates.astype('datetime64[ms]')
                 x = dn.reindex(x.index)
+                steps.append('epoch')
+
+        return steps, x
+
+    @staticmethod
+    def try_convert(x):
+        return InferTypes.infer(x)[1]
 
+    @staticmethod
+    def replay(steps, x):
+        """ converts with the inferred steps, ValueError if they don't fit """
+        dn = x.dropna().astype(str)
+        dn = dn[dn!='']
+        for step in steps:
+            if step == 'uid':
+                if not (dn.str[:1]=='u').all():
+                    raise ValueError('not only user ids')
+                dn = dn.str[1:].astype(int)
+                x = dn.reindex(x.index, fill_value=0)
+                continue
+            elif step == 'numeric':
+                dn = pd.to_numeric(dn)
+            elif step == 'dates':
+                dn = pd.to_datetime(dn, errors='raise')
+            elif step == 'bool':
+                dn = dn.map(bools)
+                if dn.isnull().any():
+                    raise ValueError('not only booleans')
+                dn = dn.astype(bool)
+            elif step == 'epoch':
+                dates = dn[dn!=0]
+                if not ((dates > 5e11) & (dates < 20e11)).all():
+                    raise ValueError('not only epoch milliseconds')
+                x = dates.astype('datetime64[ms]').reindex(x.index)
+                continue
+            x = dn.reindex(x.index, fill_value=fill_dtypes.get(dn.dtype, np.nan))
+        return x
+
+    @staticmethod
+    def settled(steps):
+        """ if the steps convert to a type, so there is nothing more to infer """
+        return bool(set(steps) - {'object'})
+
+    def convert(self, x, schema):
+        name = x.name
+        steps = schema.get(name)
+        if steps is not None:
+            try:
+                return self.replay(steps, x)
+            except (ValueError, TypeError, OverflowError):
+                self.__log.info('conversion of %s changed, inferring again', name)
+                del schema[name]
+
+        if self.sample and len(x) > self.sample:
+            steps, _ = self.infer(x.iloc[:self.sample])
+            if self.settled(steps):
+                try:
+                    x = self.replay(steps, x)
+                    schema[name] = steps
+                    return x
+                except (ValueError, TypeError, OverflowError):
+                    pass
+
+        steps, x = self.infer(x)
+        if self.settled(steps):
+            schema[name] = steps
         return x
 
     @inport
     def process(self, data : pd.DataFrame, tag):
-        data = data.apply(self.try_convert, axis=0)
+        if self.cache:
+            schema = self.schemas.setdefault(tag[self.by] if self.by else None, {})
+            data = data.apply(self.convert, axis=0, schema=schema)
+        else:
+            data = data.apply(self.try_convert, axis=0)
         yield from data >> tag >> self.out
 
 
@@ -317,47 +825,184 @@ class CollectPd(Collect):
         return pd.concat(datas)
 
 
+class SortedMergePd(SortedMerge):
+    """ merges frames sorted by the column `by` (or the index) """
+    @param
+    def by(self, val=None):
+        return val
+
+    def collect(self, chunks):
+        return chunks[0] if len(chunks) == 1 else pd.concat(chunks)
+
+    def last(self, data):
+        return sort_keys(data, self.by)[-1]
+
+    def cut(self, data, bound):
+        return np.searchsorted(sort_keys(data, self.by), bound, side='right')
+
+    def split(self, data, cut):
+        return data.iloc[:cut], data.iloc[cut:]
+
+    def combine(self, parts):
+        parts = [part for part in parts if len(part)]
+        if not parts:
+            return pd.DataFrame()
+        return sort_frame(pd.concat(parts), self.by)
+
+
+def partition(values, n):
+    """
+    stable partition of each value into one of `n` buckets, by the crc32 of
+    the distinct values, so all processes put a value into the same bucket
+    """
+    codes, uniques = pd.factorize(values)
+    if not len(uniques):
+        return np.zeros(len(codes), dtype=np.int64)
+    buckets = np.fromiter((zlib.crc32(str(u).encode()) % n for u in uniques),
+                          dtype=np.int64, count=len(uniques))
+    # missing values get code -1 and go to the first bucket
+    return np.where(codes < 0, 0, buckets.take(codes, mode='clip'))
+
+
 class Grouper(Paramed, Unit):
+    """
+    splits frames by the values of the `groupby` column
+
+    Sends one packet per group tagged with its `group`, or with `partitions`
+    one packet per bucket of groups tagged with `partition`/`partitions`,
+    where the bucket of a group is the same for all chunks and processes.
+    """
     @param
     def groupby(self, column):
         return column
 
+    @param
+    def partitions(self, val=None):
+        """ number of hash buckets for the groups """
+        return val
+
     @outport
-    def out(self, data : pd.DataFrame, tag : {'group': ...}):
+    def out(self, data : pd.DataFrame, tag : {'group': ...,
+                                              'partition': ..., 'partitions': ...}):
         pass
 
     @inport
     def process(self, data : pd.DataFrame, tag):
-        for grp, vals in data.groupby(self.groupby, sort=False):
-            yield from vals >> tag.add(group=grp) >> self.out
+        n = self.partitions
+        if n is None:
+            for grp, vals in data.groupby(self.groupby, sort=False):
+                yield from vals >> tag.add(group=grp) >> self.out
+            return
+
+        buckets = partition(data[self.groupby].values, n)
+        for part, vals in data.groupby(buckets, sort=True):
+            yield from vals >> tag.add(partition=int(part), partitions=n) >> self.out
+
+
+def where_query(data, query):
+    return data.query(query)
+
+
+def where_contains(data, filters):
+    if not data.empty:
+        for key,filt in filters.items():
+            data = data[data[key].str.contains(filt)]
+    return data
 
 
 class Query(Paramed, Unit):
+    pushed = False
+
     @param
     def query(self, query):
         return query
 
+    @property
+    def predicate(self):
+        return partial(where_query, query=self.query)
+
     @outport
     def out(self, data : pd.DataFrame, tag):
         pass
 
     @inport
+    @pushable
     def process(self, data : pd.DataFrame, tag):
-        yield from data.query(self.query) >> tag >> self.out
+        yield from where_query(data, self.query) >> tag >> self.out
 
 
 class Filter(Unit):
+    pushed = False
+
     def __init__(self, **filters):
         super().__init__()
         self.filters = filters
 
+    @property
+    def predicate(self):
+        return partial(where_contains, filters=self.filters)
+
     @outport
     def out(self, data : pd.DataFrame, tag):
         pass
 
     @inport
+    @pushable
     def process(self, data : pd.DataFrame, tag):
-        if not data.empty:
-            for key,filt in self.filters.items():
-                data = data[data[key].str.contains(filt)]
-        yield from data >> tag >> self.out
+        yield from where_contains(data, self.filters) >> tag >> self.out
+
+
+@optimizer('pushdown')
+def pushdown(tp, units):
+    """
+    push `Columns`, `Query` and `Filter` units following a `ParseTable` or
+    `ToTable` in the same process into the parser, so only the columns and
+    rows that are kept get built; the pushed units just pass the data on
+
+    `ToTable` only gets columns pushed if it is not streaming and the `names`
+    are given, as the columns have to be known in advance.
+    """
+    for u in list(tp.units.values()):
+        parser = units.get(u.id)
+        if isinstance(parser, ParseTable):
+            columns = parser.used
+        elif isinstance(parser, ToTable):
+            opts = parser.opts
+            columns = None
+            if (not parser.stream and 'names' in opts and
+                    'usecols' not in opts and 'index_col' not in opts):
+                columns = list(opts['names'])
+        else:
+            continue
+
+        pushed = []
+        predicates = []
+        nxt = chain(tp, u)
+        while nxt is not None:
+            unit = units.get(nxt.id)
+            if not isinstance(unit, (Columns, Query, Filter)) or unit.pushed:
+                break
+            elif isinstance(unit, Columns):
+                # predicates are evaluated on the selected columns
+                if columns is None or predicates:
+                    break
+                columns = list(unit.keep(columns))
+            else:
+                predicates.append(unit.predicate)
+            pushed.append(unit)
+            nxt = chain(tp, nxt)
+
+        if not pushed:
+            continue
+        logger.info('pushing %s into %s', ', '.join(map(str, pushed)), parser)
+
+        if isinstance(parser, ParseTable):
+            parser.usecols = columns
+            parser.predicates = parser.predicates + predicates
+        else:
+            if columns is not None and columns != parser.opts.get('names'):
+                parser.usecols = columns
+                parser.opts['usecols'] = columns
+            parser.predicates = parser.predicates + predicates
+        for unit in pushed:
+            unit.pushed = True
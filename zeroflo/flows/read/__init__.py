@@ -1,3 +1,3 @@
 from .ressource import *
 from .read import *
-
+from .checkpoint import *
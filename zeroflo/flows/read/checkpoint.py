@@ -0,0 +1,164 @@
+"""
+checkpoints of ingestion progress, so `Watch` and `Reader` can resume after
+a restart instead of re-ingesting from the start
+
+- `Checkpoints`: local store with delivered time slices and byte offsets per
+  access and location, shared between spaces through a json file
+- `Commit`: unit at the end of a flow committing delivered packets
+"""
+from ...core import Unit, inport, outport
+from ...ext.params import Paramed, param
+
+from pyadds.logging import log
+
+import pandas as pd
+import json
+import time
+import os
+
+
+@log
+class Checkpoints:
+    """ checkpoint store of delivered locations per access """
+    def __init__(self, path, interval=1.0):
+        self.path = path
+        self.interval = interval
+        self.state = None
+        self.saved = 0
+        # chunks delivered out of order per access and location
+        self.runs = {}
+
+    def load(self):
+        """ (re)load the store from disk """
+        try:
+            with open(self.path) as f:
+                self.state = json.load(f)
+        except FileNotFoundError:
+            self.state = {}
+        except ValueError:
+            self.__log.warning('ignoring corrupt checkpoint %s', self.path,
+                               exc_info=True)
+            self.state = {}
+        return self.state
+
+    def save(self, force=False):
+        now = time.time()
+        if not force and now - self.saved < self.interval:
+            return
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.path)
+        self.saved = now
+
+    def access(self, name):
+        if self.state is None:
+            self.load()
+        return self.state.setdefault(name, {'time': None,
+                                            'pending': {},
+                                            'done': {}})
+
+    def resume(self, *names):
+        """
+        time where ingestion should resume for the given accesses:
+        the earliest partially delivered location or
+        the end of the latest delivered one
+        """
+        self.load()
+        pending = [pd.Timestamp(p['time'])
+                   for n in names
+                   for p in self.access(n)['pending'].values()]
+        if pending:
+            return min(pending)
+        done = [pd.Timestamp(self.access(n)['time'])
+                for n in names if self.access(n)['time']]
+        if done:
+            return max(done)
+
+    def progress(self, name, path):
+        """ (done, offset) of a location """
+        self.load()
+        access = self.access(name)
+        if path in access['done']:
+            return True, 0
+        return False, access['pending'].get(path, {}).get('offset', 0)
+
+    def arrived(self, name, path, chunk, until=None, flush=False):
+        """
+        note the delivery of a chunk ending at byte `until`
+        -> (offset, done) with the end of the chunks delivered without gaps
+        and if all chunks up to the flushed one arrived
+        """
+        run = self.runs.setdefault((name, path),
+                                   {'next': 0, 'ends': {}, 'last': None})
+        if chunk >= run['next']:
+            ends = run['ends']
+            if ends.get(chunk) is None:
+                ends[chunk] = until
+            elif until is not None:
+                ends[chunk] = max(ends[chunk], until)
+        if flush:
+            run['last'] = chunk
+
+        offset = None
+        while run['next'] in run['ends']:
+            until = run['ends'].pop(run['next'])
+            if until is not None:
+                offset = until
+            run['next'] += 1
+
+        done = run['last'] is not None and run['next'] > run['last']
+        if done:
+            self.runs.pop((name, path))
+        return offset, done
+
+    def commit(self, name, path, time, end, offset=None, done=False):
+        """ commit delivery of a location up to offset or completely """
+        access = self.access(name)
+        if done:
+            access['pending'].pop(path, None)
+            access['done'][path] = str(end)
+            if not access['time'] or pd.Timestamp(end) > pd.Timestamp(access['time']):
+                access['time'] = str(end)
+
+            # forget done locations before the resume point
+            pending = [pd.Timestamp(p['time']) for p in access['pending'].values()]
+            since = min(pending) if pending else pd.Timestamp(access['time'])
+            access['done'] = {p: e for p, e in access['done'].items()
+                              if pd.Timestamp(e) > since}
+        else:
+            pending = access['pending'].setdefault(path, {'time': str(time),
+                                                          'offset': 0})
+            pending['offset'] = max(pending['offset'], offset or 0)
+        self.save(force=done)
+
+    def __repr__(self):
+        return 'Checkpoints({!r})'.format(self.path)
+
+
+def checkpoints(value):
+    if isinstance(value, str):
+        value = Checkpoints(value)
+    return value
+
+
+class Commit(Paramed, Unit):
+    """ commit packets that got through the flow to the checkpoint store """
+    @param
+    def checkpoint(self, value):
+        return checkpoints(value)
+
+    @outport
+    def out(): pass
+
+    @inport
+    def process(self, data, tag):
+        if tag.access and tag.path:
+            # packets may arrive out of order, e.g. from replicated spaces,
+            # so only chunks delivered without gaps are committed
+            offset, done = self.checkpoint.arrived(
+                tag.access, tag.path, tag.chunk or 0,
+                until=tag.read_end, flush=bool(tag.flush))
+            self.checkpoint.commit(tag.access, tag.path, tag.time, tag.end,
+                                   offset=offset, done=done)
+        yield from data >> tag >> self.out
@@ -1,5 +1,6 @@
 from ...core import asyncio, coroutine, Unit, inport, outport
 from ...ext.params import Paramed, param
+from .checkpoint import checkpoints
 
 from pyadds.logging import log
 
@@ -34,6 +35,11 @@ class Watch(Paramed, Unit):
     def num_try(self, value=3):
         return value
 
+    @param
+    def checkpoint(self, value=None):
+        """ checkpoint store (or its path) to resume from """
+        return checkpoints(value)
+
     @inport
     def process(self, start, tag):
         tz = tag.tz
@@ -62,8 +68,8 @@ class Watch(Paramed, Unit):
                                  // val * val, tz=start.tz) - off
 
         tz = start.tz
-        time = pd.Timestamp(start, tz=tz)
-
+        # a relative end is relative to the requested start, not to the
+        # point where a checkpoint resumes
         try:
             end = start + pd.datetools.to_offset(tag.end)
         except (TypeError, ValueError):
@@ -73,6 +79,14 @@ class Watch(Paramed, Unit):
             rel = pd.datetools.to_offset(tag.on).nanos
             end = pd.Timestamp(end.value // rel * rel, tz=end.tz)
 
+        if self.checkpoint:
+            resume = self.checkpoint.resume(*(a.name for a in self.accesses))
+            if resume is not None and resume > start:
+                self.__log.info('resuming from checkpoint at %s', resume)
+                start = pd.Timestamp(resume, tz=tz)
+
+        time = pd.Timestamp(start, tz=tz)
+
         self.__log.info('fetching from %s to %s', start,
                         '...' if pd.isnull(end) else end)
 
@@ -178,12 +192,12 @@ class Watch(Paramed, Unit):
                         **loc._asdict())
             if start:
                 if loc.begin < pd.Timestamp(start, tz=loc.begin.tz):
-                    t['skip_to_time'] = pd.Timestamp(start, tz=loc.begin.tz)
+                    t = t.add(skip_to_time=pd.Timestamp(start, tz=loc.begin.tz))
                 else:
                     start = None
 
             if loc.end > pd.Timestamp(end, tz=loc.end.tz):
-                t['end_at_time'] = pd.Timestamp(end, tz=loc.end.tz)
+                t = t.add(end_at_time=pd.Timestamp(end, tz=loc.end.tz))
 
             if last != access.name:
                 last = access.name
@@ -206,6 +220,17 @@ class Reader(Paramed, Unit):
     def chunksize(self, chunksize='15m'):
         return param.sizeof(chunksize)
 
+    @param
+    def checkpoint(self, value=None):
+        """ checkpoint store (or its path) to resume from """
+        return checkpoints(value)
+
+    @param
+    def resume_offset(self, value=True):
+        """ resume partially read locations at their offset,
+            disable for resources that can't be read from the middle """
+        return value
+
     @outport
     def out(): pass
 
@@ -224,9 +249,24 @@ class Reader(Paramed, Unit):
 
         access = self.accesses[name]
         resource = access.resource(path)
+
+        offset = 0
+        if self.checkpoint:
+            done, offset = self.checkpoint.progress(name, path)
+            if done:
+                self.__log.info('skipping %s, already delivered', path)
+                yield from (b''
+                            >> tag.add(flush=True, offset=0, chunk=0, size=0)
+                            >> self.out)
+                return
+            if not self.resume_offset:
+                offset = 0
+            elif offset:
+                self.__log.info('resuming %s at %d', path, offset)
+
         rq = None
         try:
-            reader, rq = (yield from resource.reader())
+            reader, rq = (yield from resource.reader(offset=offset))
         except OSError:
             if rq:
                 yield from rq.release()
@@ -236,10 +276,11 @@ class Reader(Paramed, Unit):
                             >> self.out)
                 return
             raise
-        tag.update(access.tag)
+        tag = tag.add(**access.tag)
+        if offset:
+            tag = tag.add(resumed=True)
 
         chunksize = self.chunksize
-        offset = 0
         times = waits = chunks = conts = 0
         done = False
         eof_continued = 0
@@ -308,9 +349,12 @@ class Reader(Paramed, Unit):
                     eof_continued = 0
 
                 yield from (chunk
-                            >> tag.add(size=size, offset=offset, chunk=chunks)
+                            >> tag.add(size=size, offset=offset, chunk=chunks,
+                                       read_offset=offset, read_end=offset+size)
                             >> self.out)
-                if not offset:
+                if tag.resumed:
+                    tag = tag.remove('resumed')
+                if first is None:
                     first = time.time()
                 assert size == len(chunk), 'size is right'
                 offset += size
@@ -331,7 +375,8 @@ class Reader(Paramed, Unit):
                 if eof_continued > 4:
                     yield from (b''
                                 >> tag.add(flush=True, offset=offset,
-                                           chunk=chunks, size=0)
+                                           chunk=chunks, size=0,
+                                           read_offset=offset, read_end=offset)
                                 >> self.out)
                     break
 
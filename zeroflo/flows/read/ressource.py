@@ -361,7 +361,7 @@ class UnionRessource(Ressource):
     @coroutine
     def reader(self, offset=0):
         first = yield from self._first()
-        return (yield from first.reader(offset=0))
+        return (yield from first.reader(offset=offset))
 
 
 class UnionDirectory(Directory, UnionRessource):
@@ -1,4 +1,5 @@
 from zeroflo import *
+from ..core.memory import budget, sizeof
 from pyadds.logging import *
 from collections import defaultdict
 
@@ -34,6 +35,7 @@ class Union(Paramed, Unit):
     def __setup__(self):
         self.pkids = []
         self.loads = defaultdict(list)
+        self.held = 0
 
     @coroutine
     def put(self):
@@ -42,6 +44,8 @@ class Union(Paramed, Unit):
             loads = self.loads[pkid]
             while loads:
                 data, tag = loads.pop(0)
+                self.held -= sizeof(data)
+                budget.hold(self, self.held)
                 yield from data >> tag >> self.out
                 if self.autoflush or tag.flush:
                     assert not loads, 'more after flush, check your topology'
@@ -52,13 +56,17 @@ class Union(Paramed, Unit):
     def ids(self, pkid, tag):
         self.pkids.append(pkid)
 
+    @lazy
     @inport
     def process(self, data, tag):
         if data is not None:
-            pkid = tag.pop('pkid')
+            pkid = tag.pkid
+            tag = tag.remove('pkid')
             self.__log.debug('got data for %s -> %s | %s',
                              pkid,
                              self.pkids and self.pkids[0], self.loads.keys())
             self.loads[pkid].append(data >> tag)
+            self.held += sizeof(data)
+            budget.hold(self, self.held)
 
         yield from self.put()
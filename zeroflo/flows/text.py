@@ -1,8 +1,13 @@
 from zeroflo import *
+from ..core.memory import budget, sizeof
+from .tools import Spill
 from pyadds.logging import *
 
 import re
 
+from heapq import merge
+from itertools import chain, islice
+
 class RemoveNullBytes(Paramed, Unit):
     @param
     def null(self, val=b'\x00'):
@@ -17,7 +22,7 @@ class RemoveNullBytes(Paramed, Unit):
 
     @inport
     def process(self, data, tag):
-        yield from data.replace(self.null, self.replace) >> tag >> self.out
+        yield from bytes(data).replace(self.null, self.replace) >> tag >> self.out
 
 
 class ReplaceLinefeeds(Unit):
@@ -26,38 +31,67 @@ class ReplaceLinefeeds(Unit):
 
     @inport
     def process(self, data, tag):
-        yield from data.replace(b'\r\n', b'\r\r') >> tag >> self.out
+        yield from bytes(data).replace(b'\r\n', b'\r\r') >> tag >> self.out
 
 class Chunker(Paramed, Unit):
+    """
+    cuts byte chunks after their last seperator, carrying the partial record
+    over to the next chunk
+
+    Chunks are put out as memoryviews on the incoming data, so they are only
+    copied when a carried over record has to be prepended.
+    """
     @param
     def seperator(self, val=b'\n'):
         return val
 
     @coroutine
     def __setup__(self):
-        self.nil = self.rest = self.seperator[:0]
+        self.rest = b''
 
     @outport
     def out(): pass
 
+    def carry(self, view):
+        """ append to the carried over rest """
+        rest = self.rest
+        if not isinstance(rest, bytearray):
+            rest = bytearray(rest)
+        rest += view
+        self.rest = rest
+
     @inport
     def process(self, data, tag):
-        data = self.rest + data
-
-        if not tag.flush:
-            data,*rest = data.rsplit(self.seperator, 1)
-            if rest:
-                rest, = rest
-            else:
-                rest = data
-                data = self.nil
+        sep = self.seperator
+        if isinstance(data, memoryview):
+            data = bytes(data)
+
+        start = 0
+        if self.rest:
+            # a seperator may span the carried over rest and this chunk
+            self.carry(data)
+            data = self.rest
+        elif tag.resumed:
+            # resumed in the middle of a record that was already delivered
+            start = data.find(sep)
+            start = len(data) if start < 0 else start + len(sep)
+
+        if tag.flush:
+            end = cut = len(data)
         else:
-            rest = self.nil
+            end = data.rfind(sep, start)
+            if end < 0:
+                if data is not self.rest:
+                    self.rest = memoryview(data)[start:]
+                return
+            cut = end + len(sep)
 
-        self.rest = rest
+        view = memoryview(data)
+        chunk = view[start:end]
+        self.rest = view[cut:]
 
-        if data or tag.flush:
-            yield from data >> tag >> self.out
+        if chunk or tag.flush:
+            yield from chunk >> tag >> self.out
 
 
 class Decode(Unit):
@@ -66,7 +100,7 @@ class Decode(Unit):
 
     @inport
     def process(self, data, tag):
-        yield from data.decode() >> tag >> self.out
+        yield from str(data, 'utf-8') >> tag >> self.out
 
 
 class Lines(Paramed, Unit):
@@ -108,13 +142,51 @@ class Fields(Paramed, Unit):
 
 
 @log
-class Sort(Unit):
+class Sort(Paramed, Unit):
+    """ external sort of lines, spilling sorted runs to disk """
+    @param
+    def spill(self, val='256m'):
+        """ spill a sorted run when holding this many bytes """
+        return param.sizeof(val)
+
+    @param
+    def chunk(self, val=64*1024):
+        """ number of lines per spilled and emitted chunk """
+        return val
+
     @outport
     def out(): pass
 
     @coroutine
     def __setup__(self):
         self.buf = []
+        self.held = 0
+        self.spilled = Spill(self.chunk)
+
+    @coroutine
+    def __teardown__(self):
+        self.spilled.close()
+
+    def release(self):
+        self.buf = []
+        self.held = 0
+        budget.hold(self, 0)
+
+    @coroutine
+    def flush(self, tag):
+        runs = [chain.from_iterable(chunks) for chunks in self.spilled.take()]
+        lines = merge(sorted(self.buf), *runs)
+        self.release()
+
+        partial = tag.remove('flush')
+        chunk = list(islice(lines, self.chunk))
+        while True:
+            nxt = list(islice(lines, self.chunk))
+            if not nxt:
+                break
+            yield from chunk >> partial >> self.out
+            chunk = nxt
+        yield from chunk >> tag >> self.out
 
     @inport
     def process(self, lines, tag):
@@ -125,13 +197,19 @@ class Sort(Unit):
         new = len(lines)
         self.buf.extend(lines)
         tot = len(self.buf)
-
-        if not tag.flush:
-            self.__log.debug('adding %d lines -> %d', new, tot)
+        self.held += sizeof(lines)
+        budget.hold(self, self.held)
+
+        if tag.flush:
+            self.__log.debug('flushing out %d+%d lines (%d runs spilled)',
+                             new, tot, len(self.spilled))
+            yield from self.flush(tag)
+        elif self.held >= self.spill or budget.exhausted:
+            self.__log.debug('spilling %d lines', tot)
+            self.spilled.add(sorted(self.buf))
+            self.release()
         else:
-            self.__log.debug('flushing out %d+%d lines', new, len(self.buf))
-            lines,self.buf = self.buf, []
-            yield from sorted(lines) >> tag >> self.out
+            self.__log.debug('adding %d lines -> %d', new, tot)
 
 
 class Filter(Paramed, Unit):
@@ -154,6 +232,27 @@ class Filter(Paramed, Unit):
         yield from filt >> tag.add(**self.tags) >> self.out
 
 
+def combine(rules):
+    """
+    one regex matching the first of the rules found in a line, the name of
+    the rule is `rule_names[match.lastgroup]`, or None if the patterns can't
+    be combined
+    """
+    names = {}
+    alts = []
+    for i, (name, pat) in enumerate(rules.items()):
+        if re.search(r'\\\d|\(\?P=', pat.pattern) or pat.flags & ~re.UNICODE:
+            # group numbers and flags don't carry over into the combination
+            return None, None
+        group = 'rule{}'.format(i)
+        names[group] = name
+        alts.append(r'(?=[\s\S]*?(?P<{}>{}))'.format(group, pat.pattern))
+    try:
+        return re.compile('(?:{})'.format('|'.join(alts))), names
+    except re.error:
+        return None, None
+
+
 @log
 class Matcher(Paramed, Unit):
     @param
@@ -187,29 +286,53 @@ class Matcher(Paramed, Unit):
     @outport
     def non(): pass
 
+    @property
+    def combined(self):
+        """ combined regex of the rules with the names of its groups """
+        rules = self.rules
+        if getattr(self, '_combined_rules', None) is not rules:
+            self._combined = combine(rules)
+            self._combined_rules = rules
+            if self._combined[0] is None:
+                self.__log.info('rules can not be combined, matching each')
+        return self._combined
+
+    def classify(self, lines, outs):
+        combined, names = self.combined
+        default = self.default
+        if combined is not None:
+            match = combined.match
+            for line in lines:
+                m = match(line)
+                outs[names[m.lastgroup] if m else default].append(line)
+        else:
+            rules = self.rules.items()
+            for line in lines:
+                for k, pat in rules:
+                    if pat.search(line):
+                        break
+                else:
+                    k = default
+                outs[k].append(line)
+
     @inport
     def process(self, lines, tag):
         outs = {k: [] for k in self.rules.keys()}
         outs[self.default] = []
-        for line in lines:
-            for k, pat in self.rules.items():
-                if pat.search(line):
-                    break
-            else:
-                k = self.default
-            outs[k].append(line)
+        self.classify(lines, outs)
 
         if self.one_only:
             out = [k for k, ls in outs.items() if len(ls)]
-            if len(out) > 1:
+            matched = len(out)
+            if matched > 1:
                 if self.resolve == 'most':
                     _, out = max((len(v), o) for o, v in outs.items())
                     self.__log.warning('%d matches, but one_only given, '
-                                       'using %s with most', len(out), out)
+                                       'using %s with most', matched, out)
                 elif self.resolve == 'default':
-                    out == self.default
+                    out = self.default
                     self.__log.warning('%d matches, but one_only given, '
-                                       'using %s as default', len(out), out)
+                                       'using %s as default', matched, out)
                 else:
                     raise ValueError(
                         'only one thingy should match with only_once')
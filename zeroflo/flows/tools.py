@@ -1,11 +1,16 @@
 from ..core import *
 from ..core.packet import Tag
-from ..ext import param, Paramed
+from ..core.memory import budget, sizeof
+from ..ext import param, Paramed, batch
 
 import time
+import pickle
+import tempfile
 
-from collections import defaultdict
-from heapq import merge
+from collections import defaultdict, deque, OrderedDict
+from heapq import merge, heappush, heappop
+from bisect import bisect_right
+from itertools import chain, count
 from pyadds.logging import log
 from ..compat import JoinableQueue
 
@@ -52,6 +57,97 @@ class Timing:
             return '{}:{:04.1f}'.format(*self['mins','secs'])
 
 
+class Spill:
+    """
+    sorted runs spilled to temporary files in chunks, e.g. for external sorts
+
+    Runs are sliceable sequences (lists or frames), `take` returns an
+    iterator over the chunks of each run spilled so far.
+    """
+    def __init__(self, chunk=64*1024, dir=None):
+        self.chunk = chunk
+        self.dir = dir
+        self.runs = []
+
+    def __len__(self):
+        return len(self.runs)
+
+    def add(self, run):
+        """ spill a sorted run """
+        f = tempfile.TemporaryFile(dir=self.dir)
+        chunk = self.chunk
+        rows = getattr(run, 'iloc', run)
+        for i in range(0, len(run), chunk):
+            pickle.dump(rows[i:i+chunk], f, pickle.HIGHEST_PROTOCOL)
+        f.seek(0)
+        self.runs.append(f)
+
+    def chunks(self, f):
+        """ read back the chunks of a spilled run """
+        try:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    break
+        finally:
+            f.close()
+
+    def take(self):
+        """ chunk iterators of the spilled runs, the spill is empty afterwards """
+        runs, self.runs = self.runs, []
+        return [self.chunks(f) for f in runs]
+
+    def close(self):
+        for f in self.runs:
+            f.close()
+        self.runs = []
+
+
+class SpillQueue:
+    """ fifo queue kept in memory, continued in a temporary file once spilled """
+    def __init__(self, dir=None):
+        self.dir = dir
+        self.items = deque()
+        self.file = None
+        self.spilled = 0
+        self.pos = 0
+
+    def __len__(self):
+        return len(self.items) + self.spilled
+
+    def append(self, item, spill=False):
+        """ append an item, spilling it and all following ones if `spill` """
+        if not spill and not self.spilled:
+            self.items.append(item)
+            return
+
+        if self.file is None:
+            self.file = tempfile.TemporaryFile(dir=self.dir)
+        self.file.seek(0, 2)
+        pickle.dump(item, self.file, pickle.HIGHEST_PROTOCOL)
+        self.spilled += 1
+
+    def popleft(self):
+        if self.items:
+            return self.items.popleft()
+
+        f = self.file
+        f.seek(self.pos)
+        item = pickle.load(f)
+        self.pos = f.tell()
+        self.spilled -= 1
+        if not self.spilled:
+            self.close()
+        return item
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+        self.file = None
+        self.spilled = self.pos = 0
+
+
 class Status(Paramed, Unit):
     @param
     def format(self, val='{__tag__!r}'):
@@ -84,18 +180,62 @@ def ensure(val, typ):
     return val if isinstance(val, typ) else typ([val])
 
 
+class Rules:
+    """
+    ordered rules on tag values as `[(result, [{key: values}, ...]), ...]`,
+    a tag gets the result of the first rule having any alternative where
+    all its keys have one of the values
+
+    Results are memoized by the values of the keys used in the rules, for
+    the `size` latest combinations of values.
+    """
+    def __init__(self, rules, size=4096):
+        self.rules = rules
+        self.keys = tuple(sorted({key for _, alts in rules
+                                      for alt in alts for key in alt}))
+        self.size = size
+        self.memo = OrderedDict()
+
+    def evaluate(self, values):
+        for result, alts in self.rules:
+            if any(all(values[key] in val for key, val in alt.items())
+                   for alt in alts):
+                return result
+
+    def __call__(self, tag):
+        """ result of the first matching rule or None """
+        values = tuple(tag[key] for key in self.keys)
+        memo = self.memo
+        try:
+            return memo[values]
+        except KeyError:
+            pass
+        except TypeError:
+            # unhashable values are not memoized
+            return self.evaluate(dict(zip(self.keys, values)))
+
+        result = memo[values] = self.evaluate(dict(zip(self.keys, values)))
+        if len(memo) > self.size:
+            memo.popitem(last=False)
+        return result
+
+
 class match(Unit):
     def __init__(self, **matches):
         super().__init__()
-        self.matches = {k: ensure(v, set) for k,v in matches.items()}
+        self.matches = Rules([(True, [{k: ensure(v, set)
+                                       for k,v in matches.items()}])])
 
     @outport
     def out(): pass
 
+    @lazy
+    @batch
     @inport
-    def process(self, data, tag):
-        if all(tag[key] in val for key,val in self.matches.items()):
-            yield from data >> tag >> self.out
+    def process(self, packets):
+        matches = self.matches
+        yield from [(data, tag) for data, tag in packets
+                    if matches(tag)] >> self.out
 
 
 class Categorize(Paramed, Unit):
@@ -105,9 +245,9 @@ class Categorize(Paramed, Unit):
 
     @param
     def rules(self, val):
-        return [(cat, [{k: ensure(v, set) for k,v in rule.items()}
-                       for rule in ensure(rules, list)])
-                for cat, rules in val.items()]
+        return Rules([(cat, [{k: ensure(v, set) for k,v in rule.items()}
+                             for rule in ensure(rules, list)])
+                      for cat, rules in val.items()])
 
     @param
     def default(self, val=None):
@@ -119,25 +259,40 @@ class Categorize(Paramed, Unit):
     @outport
     def non(): pass
 
+    def categorize(self, tag):
+        cat = self.rules(tag)
+        return self.default if cat is None else cat
+
+    @lazy
+    @batch
     @inport
-    def process(self, data, tag):
-        for cat, rules in self.rules:
-            if any(all(tag[key] in val for key, val in rule.items())
-                   for rule in rules):
-                break
-        else:
-            cat = self.default
+    def process(self, packets):
+        # consecutive packets for the same port go out together,
+        # keeping the order between both ports
+        run = []
+        port = None
+        for data, tag in packets:
+            cat = self.categorize(tag)
+            if cat is None:
+                nxt = self.non
+            else:
+                nxt = self.out
+                tag = tag.add(**{self.tag: cat})
+            if nxt is not port and run:
+                yield from run >> port
+                run = []
+            port = nxt
+            run.append((data, tag))
 
-        if cat is None:
-            yield from data >> tag >> self.non
-        else:
-            yield from data >> tag.add(**{self.tag: cat}) >> self.out
+        if run:
+            yield from run >> port
 
 
 class forward(Unit):
     @outport
     def out(): pass
 
+    @lazy
     @inport
     def process(self, data, tag):
         yield from data >> tag >> self.out
@@ -151,6 +306,7 @@ class addtag(Unit):
     @outport
     def out(): pass
 
+    @lazy
     @inport
     def process(self, data, tag):
         yield from data >> tag.add(**self.tag) >> self.out
@@ -173,10 +329,14 @@ class Offset(Unit):
     def __setup__(self):
         self.offset = 0
 
+    @batch
     @inport
-    def process(self, data, tag):
-        yield from data >> tag.add(offset=offset) >> self.out
-        self.offset += len(data)
+    def process(self, packets):
+        outs = []
+        for data, tag in packets:
+            outs.append((data, tag.add(offset=self.offset)))
+            self.offset += len(data)
+        yield from outs >> self.out
 
 
 @log
@@ -256,13 +416,123 @@ class Merge(Paramed, Unit):
         yield from self.queue_b.put((tag[self.by], data, tag))
 
 
+@log
+class SortedMerge(Paramed, Unit):
+    """
+    merges any number of sorted streams into one sorted stream
+
+    The packets of each stream are identified by the tag value `stream` and
+    a stream ends with a flushed packet. Incoming data is buffered and all
+    items up to the smallest last item of the unfinished streams get merged
+    and put out, so the unit never blocks its inport.
+    """
+    @param
+    def stream(self, val='path'):
+        """ tag key identifying the streams """
+        return val
+
+    @param
+    def streams(self, val):
+        """ number of streams to merge """
+        return val
+
+    @outport
+    def out(): pass
+
+    @coroutine
+    def __setup__(self):
+        self.buffers = defaultdict(list)
+        self.lasts = {}
+        self.done = set()
+        self.tag = None
+
+    def collect(self, chunks):
+        return list(chain.from_iterable(chunks))
+
+    def last(self, data):
+        return data[-1]
+
+    def cut(self, data, bound):
+        return bisect_right(data, bound)
+
+    def split(self, data, cut):
+        return data[:cut], data[cut:]
+
+    def combine(self, parts):
+        return list(merge(*parts))
+
+    @coroutine
+    def push(self):
+        lasts = self.lasts
+        done = self.done
+        final = len(done) >= self.streams
+        if final:
+            bound = None
+        else:
+            # wait for data of every unfinished stream
+            pending = [last for name, last in lasts.items() if name not in done]
+            if len(lasts) < self.streams or any(l is None for l in pending):
+                return
+            bound = min(pending)
+
+        parts = []
+        for name, chunks in list(self.buffers.items()):
+            data = self.collect(chunks)
+            if bound is None:
+                part, rest = data, ()
+            else:
+                part, rest = self.split(data, self.cut(data, bound))
+            parts.append(part)
+            if len(rest):
+                self.buffers[name] = [rest]
+            else:
+                del self.buffers[name]
+        budget.hold(self, sum(sizeof(c) for cs in self.buffers.values() for c in cs))
+
+        tag = self.tag.remove(self.stream, 'flush')
+        if final:
+            self.__log.debug('merged all %d streams', len(done))
+            self.lasts = {}
+            self.done = set()
+            tag = tag.add(flush=True)
+        elif not any(len(part) for part in parts):
+            return
+        yield from self.combine(parts) >> tag >> self.out
+
+    @inport
+    def process(self, data, tag):
+        name = tag[self.stream]
+        if len(data):
+            self.buffers[name].append(data)
+            self.lasts[name] = self.last(data)
+            budget.hold(self, sum(sizeof(c) for cs in self.buffers.values() for c in cs))
+        else:
+            self.lasts.setdefault(name, None)
+        if tag.flush:
+            self.done.add(name)
+        self.tag = tag
+        yield from self.push()
+
+
+@log
 class Reorder(Paramed, Unit):
+    """
+    puts out the packets of each `by` value in the order given on `order`,
+    packets of later values wait inside a window of `max` packets, or bytes
+    if given as size like '64m'; beyond it they get spilled to disk
+    """
     @param
     def by(self, val='path'):
         return val
 
     @param
     def max(self, val=0):
+        """ window of buffered packets (int) or bytes (str), 0 for unbounded """
+        return val
+
+    @param
+    def spill(self, val=True):
+        """ spill packets beyond the window to temporary files """
         return val
 
     @outport
@@ -270,43 +540,123 @@ class Reorder(Paramed, Unit):
 
     @coroutine
     def __setup__(self):
-        self.orders = []
-        self.queued = defaultdict(list)
+        self.orders = deque()
+        self.queued = {}
+        self.held = 0
+        self.count = 0
+        self.warned = False
+
+    @coroutine
+    def __teardown__(self):
+        for q in self.queued.values():
+            q.close()
+
+    def full(self):
+        window = self.max
+        if not window:
+            return False
+        elif isinstance(window, str):
+            return self.held >= param.sizeof(window)
+        else:
+            return self.count >= window
+
+    def account(self, load, n):
+        self.count += n
+        self.held += n * sizeof(load)
+        budget.hold(self, self.held)
+
+    @coroutine
+    def emit(self, load, tag):
+        yield from load >> tag >> self.out
+        if tag.flush:
+            key = self.orders.popleft()
+            q = self.queued.pop(key, None)
+            if q is not None:
+                assert not q, 'more after flush, check your topology'
+                q.close()
 
     @coroutine
     def push(self):
         queued = self.queued
         orders = self.orders
         while orders:
-            q = queued[orders[0]]
+            q = queued.get(orders[0])
             if not q:
                 break
 
-            load, tag = q.pop(0)
-            yield from load >> tag >> self.out
-
-            if tag.flush:
-                if queued[orders[0]]:
-                    raise
-                queued.pop(orders[0])
-                orders.pop(0)
+            inmem = bool(q.items)
+            load, tag = q.popleft()
+            if inmem:
+                self.account(load, -1)
+            yield from self.emit(load, tag)
 
     @inport
     def order(self, _, tag):
         self.orders.append(tag[self.by])
         yield from self.push()
 
+    @lazy
     @inport
     def process(self, load, tag):
-        self.queued[tag[self.by]].append((load,tag))
+        key = tag[self.by]
+        q = self.queued.get(key)
+        if not q and self.orders and self.orders[0] == key:
+            yield from self.emit(load, tag)
+            yield from self.push()
+            return
+
+        if q is None:
+            q = self.queued[key] = SpillQueue()
+        full = self.full()
+        if full and not self.spill and not self.warned:
+            self.__log.warning('reorder window of %s exceeded', self.max)
+            self.warned = True
+        # spill early when the space runs out of memory
+        spill = (full or budget.exhausted) and self.spill
+        if (spill or q.spilled) and isinstance(load, memoryview):
+            load = bytes(load)
+        q.append((load, tag), spill=spill)
+        if not q.spilled:
+            self.account(load, 1)
         yield from self.push()
 
 
+class Batch:
+    """ packets collected for one key """
+    __slots__ = ('datas', 'tag', 'total', 'size', 'first')
+
+    def __init__(self, first):
+        self.datas = []
+        self.tag = Tag()
+        self.total = 0
+        self.size = 0
+        self.first = first
+
+    def add(self, data, tag):
+        self.datas.append(data)
+        self.tag = self.tag.add(**tag)
+        self.total += len(data)
+        self.size += sizeof(data)
+
+
 @log
 class Collect(Paramed, Unit):
+    """
+    collects packets into batches per `collectby` key
+
+    Keys only have a buffer while packets are collected for them, and a
+    single timer task puts out batches lingering longer than `timeout`.
+
+    With `adaptive` set to a target latency, `number`, `length` and
+    `timeout` are only starting points: batches grow while delivering them
+    takes long, as downstream is busy or pushes back, and shrink again when
+    downstream is idle. The time batches linger scales along, up to the
+    target latency.
+    """
     @param
     def warmup(self, warmup=128):
-            return warmup
+        """ put out this many packets directly before collecting """
+        return warmup
 
     @param
     def number(self, number=4):
@@ -324,8 +674,16 @@ class Collect(Paramed, Unit):
         return timeout
 
     @param
-    def max_queued(self, max_queued=4):
-        """ maximum number of queued packets """
+    def max_keys(self, max_keys=1024):
+        """ maximum number of keys collected at once, the oldest is put out """
+        return max_keys
+
+    @param
+    def max_queued(self, max_queued=None):
+        """ deprecated and ignored, packets are no longer queued per key """
+        if max_queued is not None:
+            self.__log.warning('max_queued is deprecated and ignored, '
+                               'use max_keys to bound the collected keys')
         return max_queued
 
     @param
@@ -334,94 +692,140 @@ class Collect(Paramed, Unit):
 
     @param
     def flush(self, value=True):
+        """ put out collected packets on teardown """
         return value
 
+    @param
+    def adaptive(self, target=None):
+        """ target latency in seconds to tune batches for, None for static """
+        return target
+
     @outport
     def out(self, data, tag):
         pass
 
     @coroutine
     def __setup__(self):
-        self.queues = {}
+        self.batches = OrderedDict()
+        self.deadlines = []
+        self.sequence = count()
+        self.held = 0
+        self.warming = self.warmup
+        self.tuned = (self.number, self.length, self.timeout)
+        self.delivering = 0
+        self.wakeup = asyncio.Event()
+        self.sending = asyncio.Lock()
+        self.timer = asyncio.async(self.linger())
 
     @coroutine
     def __teardown__(self):
-        yield from asyncio.gather(*[q.put((None, None)) for q in self.queues.values()])
+        self.timer.cancel()
+        if self.flush:
+            for key in list(self.batches):
+                yield from self.emit(key)
 
     def reduce(self, datas):
         return b''.join(datas)
 
+    def limits(self):
+        """ (number, length, timeout) currently used for batches """
+        if self.adaptive:
+            return self.tuned
+        return self.number, self.length, self.timeout
+
+    def adapt(self, delivered):
+        """ tune the limits by the time it took to deliver a batch """
+        target = self.adaptive
+        self.delivering += .25 * (delivered - self.delivering)
+        if self.delivering > target / 2:
+            grow = 1.5
+        elif self.delivering < target / 4:
+            grow = .8
+        else:
+            grow = 1
+
+        number, length, timeout = self.tuned
+        number = min(max(number * grow, max(self.number / 16, 1)), self.number * 64)
+        length = min(max(length * grow, self.length / 16), self.length * 64)
+        # batches have to linger longer to fill up to the grown limits
+        timeout = min(max(timeout * grow, self.timeout / 16),
+                      max(target, self.timeout))
+        self.tuned = (number, length, timeout)
+        self.__log.debug('tuned to %d packets, %d bytes, %.3fs for %.3fs delivery',
+                         number, length, timeout, self.delivering)
+
     @coroutine
-    def pusher(self, q):
-        datas = []
-        timeout = self.timeout
-        length = self.length
-        number = self.number
-        total = 0
-        count = 0
-        tag = Tag()
-        first = None
-        warmup = self.warmup
-
-        reduce = self.reduce
-        #release = ctx.release
+    def emit(self, key):
+        batch = self.batches.pop(key)
+        self.held -= batch.size
+        budget.hold(self, self.held)
+        # the timer and the inport both emit, keep their batches in order
+        with (yield from self.sending):
+            start = time.time()
+            yield from self.reduce(batch.datas) >> batch.tag.add(
+                    collected_num = len(batch.datas),
+                    collected_delta = start - batch.first
+                    ) >> self.out
+            if self.adaptive:
+                self.adapt(time.time() - start)
 
+    @coroutine
+    def linger(self):
+        """ timer task putting out batches when their deadline passed """
+        deadlines = self.deadlines
+        batches = self.batches
         while True:
-            flush = False
+            now = time.time()
+            while deadlines and deadlines[0][0] <= now:
+                _, _, key, batch = heappop(deadlines)
+                # batches put out before their deadline are skipped
+                if batches.get(key) is batch:
+                    yield from self.emit(key)
+
+            self.wakeup.clear()
+            wait = deadlines[0][0] - time.time() if deadlines else None
+            try:
+                yield from asyncio.wait_for(self.wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
 
-            if datas:
-                try:
-                    data,t = yield from asyncio.wait_for(q.get(),
-                            first + timeout - time.time())
-                except asyncio.TimeoutError:
-                    flush = True
-            else:
-                data,t = yield from q.get()
-                first = time.time()
-
-            if t is None and data is None and self.flush:
-                flush = True
-
-            if not flush and t is not None:
-                tag.update(t)
-                datas.append(data)
-                total += len(data)
-                count += 1
-
-            if warmup:
-                warmup -= 1
-                count = number
-
-            if flush or count > number or total > length or t is None or tag.flush:
-                if datas:
-                    out = reduce(datas)
-                    yield from out >> tag.add(
-                            collected_num = len(datas),
-                            collected_delta = time.time() - first
-                            ) >> self.out
-                    #yield from ctx.release(count)
-                    total = count = 0
-                    datas=[]
-                    tag = Tag()
-
-            if not flush and t is None:
-                break
+    @coroutine
+    def collect(self, key):
+        if len(self.batches) >= self.max_keys:
+            oldest = next(iter(self.batches))
+            self.__log.debug('too many keys, putting out %s', oldest)
+            yield from self.emit(oldest)
+
+        now = time.time()
+        batch = self.batches[key] = Batch(now)
+        _, _, timeout = self.limits()
+        deadline = (now + timeout, next(self.sequence), key, batch)
+        heappush(self.deadlines, deadline)
+        if self.deadlines[0] is deadline:
+            self.wakeup.set()
+        return batch
 
     @inport
     def process(self, data, tag):
-        #ctx = self.ctx
-        #yield from ctx.aquire()
-
-        by = tag.get(self.collectby)
-        try:
-            q = self.queues[by]
-        except KeyError:
-            self.__log.info('new queue for %s', by)
-            q = asyncio.Queue(self.max_queued)
-            asyncio.async(self.pusher(q))
-            self.queues[by] = q
-
-        yield from q.put((data, tag))
+        key = tag.get(self.collectby)
+        batch = self.batches.get(key)
+
+        if batch is None and self.warming:
+            self.warming -= 1
+            with (yield from self.sending):
+                yield from data >> tag.add(collected_num=1, collected_delta=0) >> self.out
+            return
+
+        if batch is None:
+            batch = yield from self.collect(key)
+        batch.add(data, tag)
+        self.held += sizeof(data)
+        budget.hold(self, self.held)
+
+        number, length, _ = self.limits()
+        if (tag.flush or len(batch.datas) > number or batch.total > length
+                or budget.exhausted):
+            yield from self.emit(key)
 
 
 